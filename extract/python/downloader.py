@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor de descarga asíncrono compartido por `sst.py`, `depth.py` y `clorophyll.py`.
+
+- Una sola `aiohttp.ClientSession` (token EDL como Bearer) con pool de
+  conexiones por host: sin coste de sesión/TLS por archivo.
+- Límite global de concurrencia adaptativo (AIMD): se reduce a la mitad
+  ante 429/503 (respetando Retry-After) y crece de uno en uno tras una
+  racha de descargas correctas.
+- Reanudación con `Range` y archivo de estado SQLite (ver `resumable.py`).
+- Integridad (ver `integrity.py`): hash incremental mientras llegan los
+  chunks, comparación con sumas publicadas (`--checksums`) y apertura de la
+  cabecera NetCDF/HDF5/TIFF antes de marcar un archivo como completo.
+- Una única barra de progreso agregada (bytes, archivos, concurrencia).
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import logging
+from pathlib import Path
+
+import aiohttp
+from dotenv import load_dotenv
+from tqdm import tqdm
+
+from resumable import DownloadState, STATE_FILE, fname, diagnose_auth_issue, hash_prefix, is_complete
+from integrity import IntegrityError, MultiHash, read_checksums, verify
+
+CHUNK = 1024 * 1024          # bytes por lectura del socket
+THROTTLE_STATUS = {429, 503}
+MAX_THROTTLES = 20           # 429/503 tolerados por archivo (no cuentan como reintento)
+
+
+class Throttled(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status} (throttling)")
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """
+    Semáforo con límite variable compartido por todas las descargas.
+
+    throttle() divide el límite entre dos y pausa los nuevos arranques
+    `retry_after` segundos; success() lo sube en uno por cada "ventana"
+    de `limit` éxitos seguidos, hasta `max_limit`.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self.active = 0
+        self._ok = 0
+        self._paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    async def success(self):
+        async with self._cond:
+            self._ok += 1
+            if self._ok >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._ok = 0
+                self._cond.notify_all()
+
+    async def throttle(self, retry_after=None):
+        async with self._cond:
+            self.limit = max(self.min_limit, self.limit // 2)
+            self._ok = 0
+            wait = retry_after if retry_after else 1.0 + random.random()
+            self._paused_until = max(self._paused_until, time.monotonic() + wait)
+
+
+class Progress:
+    """Barra única: bytes descargados, archivos terminados/fallidos y concurrencia actual."""
+
+    def __init__(self, n_files, limiter):
+        self.n_files = n_files
+        self.limiter = limiter
+        self.done = self.failed = self.skipped = 0
+        self.bytes = 0
+        self.t0 = time.perf_counter()
+        self.bar = tqdm(total=0, unit="B", unit_scale=True, unit_divisor=1024, desc="Descargando")
+
+    def expect(self, n_bytes):
+        self.bar.total += n_bytes
+        self.bar.refresh()
+
+    def advance(self, n_bytes):
+        self.bytes += n_bytes
+        self.bar.update(n_bytes)
+
+    def finish(self, ok, skipped=False):
+        self.done += ok
+        self.failed += not ok
+        self.skipped += skipped
+        self.bar.set_postfix(archivos=f"{self.done + self.failed}/{self.n_files}",
+                             fallos=self.failed, conc=self.limiter.limit)
+
+    def close(self):
+        self.bar.close()
+        return time.perf_counter() - self.t0
+
+
+def retry_after_seconds(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None  # ausente o en formato fecha HTTP
+
+
+async def fetch(session, url, tmp, offset, hasher, progress):
+    """
+    Una petición GET (con `Range: bytes=<offset>-` si offset > 0) escrita en `tmp`.
+
+    Si el servidor responde 200 a un Range se reescribe desde cero. Devuelve
+    (hasher, tamaño esperado o None).
+    """
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    async with session.get(url, headers=headers) as r:
+        if r.status in THROTTLE_STATUS:
+            raise Throttled(r.status, retry_after_seconds(r.headers.get("Retry-After")))
+        if r.status == 416 and offset:
+            tmp.unlink()  # .part más largo que el recurso: se empieza de nuevo
+            raise IOError("Range fuera del recurso; se descarta el .part")
+        r.raise_for_status()
+        if offset and r.status != 206:
+            logging.debug(f"[{tmp.name}] el servidor ignora Range; reinicio desde 0")
+            offset = 0
+            hasher = hasher.fresh()
+
+        length = r.content_length
+        expected = offset + length if length is not None else None
+        progress.expect(length or 0)
+        received = 0
+        try:
+            with open(tmp, "r+b" if offset else "wb") as w:
+                w.seek(offset)
+                w.truncate()
+                async for data in r.content.iter_chunked(CHUNK):
+                    w.write(data)
+                    hasher.update(data)
+                    received += len(data)
+                    progress.advance(len(data))
+        finally:
+            if length is not None and received < length:
+                progress.expect(received - length)  # lo que no llegó sale del total
+    return hasher, expected
+
+
+async def download(session, limiter, progress, state, url, outdir, logical_retries=3, checksums=None):
+    """
+    Descarga reanudable de una URL; devuelve (url, ok, msg_error).
+
+    `checksums` es {nombre: (algoritmo, hexdigest)}; si la suma o la
+    estructura no cuadran se borra el `.part` y se reintenta desde cero.
+    """
+    name = fname(url)
+    dest = outdir / name
+    tmp = outdir / (name + ".part")
+    expected_sum = (checksums or {}).get(name)
+    algos = (expected_sum[0],) if expected_sum else ()
+
+    if is_complete(state, url, dest):
+        progress.finish(True, skipped=True)
+        return (url, True, "")
+
+    attempt, throttles, last_err = 0, 0, ""
+    while attempt < logical_retries:
+        offset = tmp.stat().st_size if tmp.exists() else 0
+        try:
+            hasher = MultiHash(algos)
+            if offset:
+                # Rehashear un .part de varios GB: en un hilo y fuera del limitador, para no
+                # bloquear el event loop (ni las demás descargas ni la señal de latencia AIMD)
+                await asyncio.to_thread(hash_prefix, tmp, offset, hasher)
+            async with limiter:
+                state.update(url, tmp, "partial", bytes_done=offset)
+                hasher, expected = await fetch(session, url, tmp, offset, hasher, progress)
+
+            # Validación por tamaño si el servidor lo informó
+            done = tmp.stat().st_size
+            if expected is not None and done != expected:
+                raise IOError(f"Tamaño descargado {done} != esperado {expected}")
+            try:
+                await asyncio.to_thread(verify, tmp, name, hasher, expected_sum)
+            except IntegrityError:
+                tmp.unlink()  # reanudar un .part corrupto no lo arregla
+                raise
+
+            tmp.replace(dest)
+            state.update(url, dest, "complete", size=done, bytes_done=done,
+                         sha256=hasher.hexdigest(), error=None)
+            await limiter.success()
+            logging.debug(f"[OK] {name} -> {dest}")
+            progress.finish(True)
+            return (url, True, "")
+        except Throttled as e:
+            throttles += 1
+            await limiter.throttle(e.retry_after)
+            logging.debug(f"[{name}] {e}; concurrencia -> {limiter.limit}")
+            if throttles >= MAX_THROTTLES:
+                last_err = f"{e} x{throttles}"
+                break
+            continue
+        except IntegrityError as e:
+            attempt += 1
+            last_err = f"[intento {attempt}/{logical_retries}] Integridad: {e}"
+        except aiohttp.ClientResponseError as e:
+            attempt += 1
+            last_err = f"[intento {attempt}/{logical_retries}] {diagnose_auth_issue(e)}"
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            attempt += 1
+            last_err = f"[intento {attempt}/{logical_retries}] {type(e).__name__}: {e}"
+
+        # Backoff fuera del limitador: el hueco lo aprovecha otra descarga
+        logging.debug(f"[WARN] {name}: {last_err}")
+        done = tmp.stat().st_size if tmp.exists() else 0
+        state.update(url, tmp, "partial", bytes_done=done, error=last_err)
+        if attempt < logical_retries:
+            await asyncio.sleep(min(5, 2 ** (attempt - 1)))
+
+    state.update(url, tmp, "failed", error=last_err)
+    logging.warning(f"[FAIL] {name}: {last_err}")
+    progress.finish(False)
+    return (url, False, last_err)
+
+
+async def download_all(urls, outdir, state, headers=None, concurrency=16, per_host=0, logical_retries=3,
+                       checksums=None):
+    """Descarga todas las URLs con una sesión compartida; devuelve (resultados, segundos, bytes)."""
+    limiter = AdaptiveLimiter(concurrency)
+    progress = Progress(len(urls), limiter)
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=60, sock_read=300)
+    try:
+        async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                         timeout=timeout, trust_env=True) as session:
+            results = await asyncio.gather(*(
+                download(session, limiter, progress, state, u, outdir, logical_retries, checksums)
+                for u in urls))
+    finally:
+        elapsed = progress.close()
+    return results, elapsed, progress.bytes
+
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Descarga asíncrona con token EDL: concurrencia adaptativa, reanudación y una barra de progreso."
+    )
+    p.add_argument("-u","--urls-file", help="Archivo de texto con una URL por línea.")
+    p.add_argument("-o","--outdir", default="downloads", help="Directorio de salida (default: downloads)")
+    p.add_argument("-w","--workers", type=int, default=16, help="Descargas simultáneas máximas (default: 16)")
+    p.add_argument("--per-host", type=int, default=0, help="Conexiones máximas por host (default: sin límite propio)")
+    p.add_argument("--logical-retries", type=int, default=3, help="Reintentos lógicos por archivo (default: 3)")
+    p.add_argument("--state", help=f"Archivo SQLite de estado (default: <outdir>/{STATE_FILE})")
+    p.add_argument("--checksums", help="Manifiesto de sumas publicadas ('<digest>  <archivo>' por línea; md5/sha1/sha256/sha512)")
+    p.add_argument("--debug", action="store_true", help="Activa logging DEBUG detallado")
+    return p.parse_args()
+
+
+def setup_logging(debug: bool):
+    level = logging.DEBUG if debug else logging.INFO
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s | %(levelname)-7s | %(message)s",
+        datefmt="%H:%M:%S"
+    )
+
+
+def read_urls(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        return [ln.strip() for ln in fh if ln.strip() and not ln.strip().startswith("#")]
+
+
+def main(default_urls_file):
+    args = parse_args()
+    setup_logging(args.debug)
+
+    # 1) Cargar .env (el token EDL va como Bearer en todas las peticiones)
+    load_dotenv()
+    token = os.getenv("EARTHDATA_TOKEN")
+    logging.info(f"EARTHDATA_TOKEN presente: {bool(token)}")
+    if not token:
+        logging.error("No se encontró EARTHDATA_TOKEN en el entorno (.env).")
+        sys.exit(1)
+
+    # 2) Leer URLs
+    urls = read_urls(args.urls_file or default_urls_file)
+    logging.info(f"Total de URLs a procesar: {len(urls)}")
+    if not urls:
+        logging.error("No hay URLs para descargar.")
+        sys.exit(1)
+
+    # 3) Preparar salida y estado persistente
+    outdir = Path(args.outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    state = DownloadState(args.state or outdir / STATE_FILE)
+    checksums = read_checksums(args.checksums) if args.checksums else None
+    if checksums is not None:
+        logging.info(f"Sumas publicadas cargadas: {len(checksums)}")
+
+    # 4) Descargas
+    results, elapsed, n_bytes = asyncio.run(download_all(
+        urls, outdir, state, headers={"Authorization": f"Bearer {token}"},
+        concurrency=args.workers, per_host=args.per_host, logical_retries=args.logical_retries,
+        checksums=checksums))
+    failures = [(u, m) for u, ok, m in results if not ok]
+    logging.info(f"Estado ({state.path}): {state.summary()}")
+    state.close()
+
+    # 5) Resumen
+    rate = lambda x: x / elapsed if elapsed > 0 else float("nan")
+    print("\nResumen:")
+    print(f"  Total: {len(urls)}")
+    print(f"  Exitosas: {len(urls) - len(failures)}")
+    print(f"  Fallidas: {len(failures)}")
+    print(f"  {elapsed:.1f} s | {rate(len(urls) - len(failures)):.1f} archivos/s | {rate(n_bytes) / 2**20:.1f} MB/s")
+    if failures:
+        print("\nDescargas fallidas:")
+        for u, m in failures:
+            print(f"- {u}")
+            if m:
+                print(f"  Motivo: {m}")
+        print("\nSi aparece el mensaje de autorización URS:")
+        print("  1) Abre cualquiera de las URLs en tu navegador autenticado en Earthdata.")
+        print("  2) Pulsa 'Authorize' para el endpoint/app (paso único).")
+        print("  3) Ejecuta de nuevo el script.")
@@ -1,83 +1,301 @@
-import cdsapi
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
-import multiprocessing
+import re
+import json
 import time
+import tarfile
+import zipfile
+import calendar
+import argparse
+from datetime import date
+
+import cdsapi
+import cdsapi.api
+
+from integrity import check_structure
 
 # === CONFIGURATION ===
 DATASET = "satellite-sea-level-global"
 OUTPUT_DIR = "downloads/eke/data"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+JOBS_FILE = ".cds_jobs.json"   # submitted CDS jobs, under OUTPUT_DIR
+
+YEARS = [2014, 2015, 2016, 2017]
+POLL_SECONDS = 30
+MAX_POLL_ERRORS = 5  # consecutive status-check errors before a job counts as failed
 
-YEARS = ["2014", "2015", "2016", "2017"]
-MONTHS = [f"{m:02d}" for m in range(1, 13)]
-DAYS = [f"{d:02d}" for d in range(1, 32)]
+DONE_STATES = {"completed", "successful"}
+PENDING_STATES = {"queued", "accepted", "running"}
+# Anything else (failed, rejected, dismissed, deleted, expired, unknown ids...) ends the job
 
-MAX_RETRIES = 3
-MAX_WORKERS = min(8, multiprocessing.cpu_count())  # Limit threads to 8 or CPU cores
 
-# === CLIENT INSTANCE ===
-client = cdsapi.Client()
+def day_file(day: date, output_dir=OUTPUT_DIR) -> str:
+    return os.path.join(output_dir, f"{DATASET}_{day:%Y%m%d}.nc")
 
 
-def download_day(year: str, month: str, day: str) -> tuple[str, bool]:
+def plan_requests(years, output_dir=OUTPUT_DIR):
     """
-    Download a single day of data. Returns (filename, success_flag)
+    One request per (year, month) listing only the real calendar days
+    whose per-day file is not on disk yet, or is there but does not open
+    as NetCDF (truncated, HTML error page...). ZIP/GZIP archives saved
+    under the .nc name by the old downloader count as present when the
+    .nc inside is readable. Months with nothing missing are left out.
     """
-    filename = f"{DATASET}_{year}{month}{day}.nc"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    plan = []
+    for year in years:
+        for month in range(1, 13):
+            n_days = calendar.monthrange(year, month)[1]
+            missing = [d for d in range(1, n_days + 1)
+                       if not is_valid_day(day_file(date(year, month, d), output_dir))]
+            if missing:
+                plan.append((year, month, missing))
+    return plan
+
 
-    # Skip if already exists
-    if os.path.exists(filepath):
-        return (filename, True)
+def is_valid_day(path):
+    if not os.path.exists(path):
+        return False
+    problem = check_structure(path)
+    if problem:
+        print(f"⚠️  {os.path.basename(path)}: {problem}; requesting it again")
+    return problem is None
 
-    request = {
+
+def build_request(year, month, days):
+    return {
         "variable": ["daily"],
-        "year": [year],
-        "month": [month],
-        "day": [day],
+        "year": [str(year)],
+        "month": [f"{month:02d}"],
+        "day": [f"{d:02d}" for d in days],
         "version": "vdt2018",
     }
 
-    # Retry mechanism
-    for attempt in range(1, MAX_RETRIES + 1):
+
+# --- cdsapi adapters (legacy cdsapi Result and the newer CADS Remote) ---
+
+def submit_job(client, request):
+    """Queue a request without waiting; returns (job, request_id)."""
+    job = client.retrieve(DATASET, request)
+    if hasattr(job, "request_id"):  # CADS Remote
+        return job, job.request_id
+    return job, job.reply["request_id"]
+
+
+def resume_job(client, request_id):
+    """Handle on an already submitted job, to keep polling it after a restart."""
+    inner = getattr(client, "client", None)
+    if inner is not None and hasattr(inner, "get_remote"):
+        return inner.get_remote(request_id)
+    return cdsapi.api.Result(client, {"request_id": request_id, "state": "queued"})
+
+
+def job_state(job):
+    if hasattr(job, "status"):  # CADS Remote: each access queries the API
+        return job.status
+    job.update()
+    return job.reply.get("state", "queued")
+
+
+# --- Jobs file (resume after a crash) ---
+
+def load_jobs(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_jobs(path, jobs):
+    """Write the jobs file atomically (temp file + rename)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(jobs, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# --- Unpacking ---
+
+def member_day(name):
+    """Date of a DUACS member name (first YYYYMMDD in it), e.g. dt_global_allsat_phy_l4_20140101_20190101.nc."""
+    for token in re.findall(r"(?<!\d)(\d{8})(?!\d)", os.path.basename(name)):
         try:
-            client.retrieve(DATASET, request).download(filepath)
-            return (filename, True)
-        except Exception as e:
-            time.sleep(2 * attempt)  # exponential backoff
-            if attempt == MAX_RETRIES:
-                return (filename, False)
-    return (filename, False)
+            return date(int(token[:4]), int(token[4:6]), int(token[6:]))
+        except ValueError:
+            continue
+    return None
 
 
-def main():
-    # Prepare all tasks
-    tasks = [(y, m, d) for y in YEARS for m in MONTHS for d in DAYS]
-    total = len(tasks)
+def _write_atomic(src, target):
+    """Copy `src` to `target` through a .part file that must open as NetCDF first."""
+    tmp = target + ".part"
+    with open(tmp, "wb") as dst:
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            dst.write(chunk)
+    problem = check_structure(tmp, target)
+    if problem:
+        os.remove(tmp)
+        raise ValueError(f"{os.path.basename(target)}: {problem}")
+    os.replace(tmp, target)
+
+
+def unpack_archive(archive, days, output_dir=OUTPUT_DIR):
+    """
+    Split a downloaded CDS archive (zip, tar or a single NetCDF) into
+    per-day files named like the old one-request-per-day downloads.
+    Returns the days written.
+    """
+    written = []
+    with open(archive, "rb") as fh:
+        head = fh.read(4)
+
+    if head.startswith(b"PK"):
+        with zipfile.ZipFile(archive) as zf:
+            for name in zf.namelist():
+                day = member_day(name)
+                if name.endswith(".nc") and day:
+                    with zf.open(name) as src:
+                        _write_atomic(src, day_file(day, output_dir))
+                    written.append(day)
+    elif tarfile.is_tarfile(archive):
+        with tarfile.open(archive) as tf:
+            for m in tf.getmembers():
+                day = member_day(m.name)
+                if m.isfile() and m.name.endswith(".nc") and day:
+                    _write_atomic(tf.extractfile(m), day_file(day, output_dir))
+                    written.append(day)
+    elif len(days) == 1:
+        # Single-day requests may come back as a bare NetCDF
+        target = day_file(days[0], output_dir)
+        problem = check_structure(archive, target)
+        if problem:
+            raise ValueError(f"{os.path.basename(target)}: {problem}")
+        os.replace(archive, target)
+        return days
+    else:
+        raise ValueError(f"Unexpected archive format for {archive}")
 
-    print(f"🚀 Starting downloads to {OUTPUT_DIR}")
-    print(f"Using {MAX_WORKERS} parallel threads and retry={MAX_RETRIES}")
+    os.remove(archive)
+    return written
+
+
+# --- Main loop ---
+
+def run(client, years=YEARS, output_dir=OUTPUT_DIR, poll_seconds=POLL_SECONDS):
+    """
+    Submit month-sized requests for missing days, poll all of them until
+    they finish, then download and unpack each archive. Job ids are kept
+    in JOBS_FILE so a crashed run resumes polling instead of re-queueing.
+    A resumed job that the server reports as failed, expired or unknown
+    (or whose results can no longer be downloaded) is resubmitted once;
+    its stale id is dropped from JOBS_FILE. Returns {month key: error}
+    for months that failed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs_path = os.path.join(output_dir, JOBS_FILE)
+    jobs = load_jobs(jobs_path)
+    plan = plan_requests(years, output_dir)
+    print(f"🗓️  {sum(len(d) for _, _, d in plan)} missing days in {len(plan)} month requests "
+          f"({len(jobs)} jobs from a previous run)")
 
-    # Run downloads in parallel with progress bar
-    success_count = 0
-    fail_count = 0
+    # 1) Submit (or resume) one job per month
+    handles, resumed = {}, set()
+    failures, poll_errors = {}, {}
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(download_day, y, m, d): (y, m, d) for (y, m, d) in tasks}
+    def submit(key, year, month, days):
+        job, request_id = submit_job(client, build_request(year, month, days))
+        jobs[key] = {"request_id": request_id, "year": year, "month": month, "days": days}
+        save_jobs(jobs_path, jobs)
+        handles[key] = job
+        resumed.discard(key)
+        print(f"📨 {key}: submitted job {request_id} ({len(days)} days)")
 
-        for future in tqdm(as_completed(futures), total=total, desc="Downloading", unit="file"):
-            filename, success = future.result()
-            if success:
-                success_count += 1
+    # Jobs for months that no longer miss any day are of no use
+    planned = {f"{year}-{month:02d}" for year, month, _ in plan}
+    for key in [k for k in jobs if k not in planned]:
+        print(f"🧹 {key}: dropping job {jobs.pop(key).get('request_id')} (nothing missing)")
+    save_jobs(jobs_path, jobs)
+
+    for year, month, days in plan:
+        key = f"{year}-{month:02d}"
+        entry = jobs.get(key)
+        if entry and entry.get("request_id") and set(days) <= set(entry["days"]):
+            try:
+                handles[key] = resume_job(client, entry["request_id"])
+            except Exception as e:
+                print(f"♻️  {key}: cannot resume job {entry['request_id']} ({e}); resubmitting")
+            else:
+                resumed.add(key)
+                print(f"🔁 {key}: resuming job {entry['request_id']}")
+                continue
+        submit(key, year, month, days)
+
+    def retry_stale(key, reason):
+        """Resubmit a job inherited from a previous run whose id is no longer usable."""
+        if key not in resumed:
+            return False
+        entry = jobs[key]
+        print(f"♻️  {key}: job {entry['request_id']} {reason}; resubmitting")
+        poll_errors.pop(key, None)
+        submit(key, entry["year"], entry["month"], entry["days"])
+        return True
+
+    # 2) Poll until every job is done, downloading as they complete
+    while handles:
+        for key in sorted(handles):
+            entry = jobs[key]
+            try:
+                state = job_state(handles[key])
+                error = f"job {entry['request_id']} {state}"
+                poll_errors.pop(key, None)
+            except Exception as e:
+                poll_errors[key] = poll_errors.get(key, 0) + 1
+                state = "failed" if poll_errors[key] >= MAX_POLL_ERRORS else "queued"
+                error = f"status check failed: {e}"
+
+            if state in PENDING_STATES:
+                continue
+            if state in DONE_STATES:
+                try:
+                    archive = os.path.join(output_dir, f"{DATASET}_{key}.download")
+                    handles[key].download(archive)
+                    days = [date(entry["year"], entry["month"], d) for d in entry["days"]]
+                    written = unpack_archive(archive, days, output_dir)
+                    print(f"✅ {key}: {len(written)} daily files")
+                except Exception as e:
+                    if retry_stale(key, f"results unavailable ({e})"):
+                        continue
+                    failures[key] = f"download/unpack failed: {e}"
+                    print(f"❌ {key}: {failures[key]}")
             else:
-                fail_count += 1
+                # failed, expired or unknown on the server
+                if retry_stale(key, error):
+                    continue
+                failures[key] = error
+                print(f"❌ {key}: {error}")
+            # Finished either way; a failed month is resubmitted by the next run
+            del handles[key], jobs[key]
+            save_jobs(jobs_path, jobs)
+        if handles:
+            time.sleep(poll_seconds)
+
+    return failures
+
+
+def main():
+    p = argparse.ArgumentParser(description=f"Download {DATASET} daily files with month-sized CDS requests.")
+    p.add_argument("--years", type=int, nargs="+", default=YEARS)
+    p.add_argument("-o", "--outdir", default=OUTPUT_DIR)
+    p.add_argument("--poll", type=float, default=POLL_SECONDS, help="Seconds between job status checks")
+    args = p.parse_args()
+
+    client = cdsapi.Client(wait_until_complete=False)
+    failures = run(client, args.years, args.outdir, args.poll)
 
-    print(f"\n✅ Completed downloads.")
-    print(f"   Successful: {success_count}")
-    print(f"   Failed:     {fail_count}")
-    print(f"   Files saved in: {os.path.abspath(OUTPUT_DIR)}")
+    print(f"\n✅ Completed. Failed months: {len(failures)}")
+    for key, error in failures.items():
+        print(f"   {key}: {error}")
+    print(f"   Files saved in: {os.path.abspath(args.outdir)}")
 
 
 if __name__ == "__main__":
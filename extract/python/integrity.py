@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Comprobaciones de integridad de las descargas (usadas por `downloader.py` y `eke.py`).
+
+- Sumas publicadas: manifiesto con líneas `<hexdigest>  <archivo>` (formato de
+  sha256sum/sha1sum/md5sum, p. ej. la salida `cksum=1` de la API file_search de
+  OB.DAAC). El algoritmo se deduce de la longitud del digest.
+- Hash incremental: `MultiHash` alimenta varios algoritmos con los mismos
+  chunks mientras se descarga, sin releer el archivo.
+- Estructura: NetCDF clásico por su cabecera; NetCDF-4/HDF5 abriéndolo con
+  h5py, que detecta archivos truncados (EOF guardado en el superbloque);
+  GeoTIFF por su cabecera. Un ZIP/GZIP guardado con nombre .nc (entregas
+  antiguas de CDS, que transform/eke.py lee igual) vale si el .nc que
+  contiene pasa la misma comprobación.
+"""
+
+import gzip
+import shutil
+import hashlib
+import zipfile
+import tempfile
+from pathlib import Path
+
+import h5py
+
+DIGEST_ALGOS = {32: "md5", 40: "sha1", 64: "sha256", 128: "sha512"}
+NETCDF_MAGIC = (b"CDF\x01", b"CDF\x02", b"CDF\x05")
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+HDF_SUFFIXES = {".nc", ".nc4", ".h5", ".he5", ".hdf5"}
+TIFF_SUFFIXES = {".tif", ".tiff"}
+ZIP_MAGIC = b"PK\x03\x04"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class IntegrityError(IOError):
+    """Archivo descargado que no pasa la verificación (se descarta el .part)."""
+
+
+class MultiHash:
+    """Varios hashlib actualizados con los mismos bytes en una sola pasada."""
+
+    def __init__(self, algos=("sha256",)):
+        self.hashes = {a: hashlib.new(a) for a in dict.fromkeys(("sha256", *algos))}
+
+    def update(self, data):
+        for h in self.hashes.values():
+            h.update(data)
+
+    def hexdigest(self, algo="sha256"):
+        return self.hashes[algo].hexdigest()
+
+    def fresh(self):
+        return MultiHash(self.hashes)
+
+
+def _is_digest(token):
+    return len(token) in DIGEST_ALGOS and all(c in "0123456789abcdef" for c in token.lower())
+
+
+def read_checksums(path):
+    """{nombre de archivo: (algoritmo, hexdigest)} de un manifiesto (digest y nombre en cualquier orden)."""
+    sums = {}
+    with open(path, "r", encoding="utf-8") as fh:
+        for ln in fh:
+            parts = ln.split()
+            if len(parts) < 2 or parts[0].startswith("#"):
+                continue
+            if _is_digest(parts[0]):
+                digest, name = parts[0], parts[-1]
+            elif _is_digest(parts[-1]):
+                digest, name = parts[-1], parts[0]
+            else:
+                continue
+            name = Path(name.lstrip("*")).name  # "*" = modo binario de sha256sum
+            sums[name] = (DIGEST_ALGOS[len(digest)], digest.lower())
+    return sums
+
+
+def check_structure(path, name=None):
+    """
+    None si el archivo parece íntegro; si no, el motivo.
+
+    El tipo se decide por la extensión de `name` (por defecto `path`), para
+    poder comprobar un `.part` antes de renombrarlo. Extensiones desconocidas
+    no se comprueban.
+    """
+    suffix = Path(name or path).suffix.lower()
+    with open(path, "rb") as fh:
+        head = fh.read(8)
+    if not head:
+        return "archivo vacío"
+    if suffix in HDF_SUFFIXES:
+        if head.startswith((ZIP_MAGIC, GZIP_MAGIC)):
+            return _check_container(path, head, suffix)
+        if head.startswith(NETCDF_MAGIC):
+            return None
+        try:
+            with h5py.File(path, "r") as f:
+                f.keys()
+        except OSError as e:
+            return f"NetCDF/HDF5 ilegible: {e}"
+    elif suffix in TIFF_SUFFIXES and not head.startswith(TIFF_MAGIC):
+        return f"cabecera TIFF no válida ({head[:4]!r})"
+    return None
+
+
+def _check_container(path, head, suffix):
+    """Desempaqueta a un temporal el .nc de un ZIP/GZIP (como transform/eke.py:open_daily) y lo comprueba."""
+    with tempfile.TemporaryDirectory() as tmp:
+        inner = Path(tmp) / f"inner{suffix}"
+        try:
+            if head.startswith(ZIP_MAGIC):
+                with zipfile.ZipFile(path) as zf:
+                    members = [m for m in zf.namelist() if Path(m).suffix.lower() in HDF_SUFFIXES]
+                    if not members:
+                        return "ZIP sin ningún .nc dentro"
+                    with zf.open(members[0]) as src, open(inner, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+            else:
+                with gzip.open(path, "rb") as src, open(inner, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        except (OSError, EOFError, zipfile.BadZipFile) as e:
+            return f"archivo comprimido ilegible: {e}"
+        problem = check_structure(inner)
+        return f"contenido del archivo comprimido: {problem}" if problem else None
+
+
+def verify(path, name, hasher=None, expected=None):
+    """
+    Verifica suma publicada (`expected` = (algoritmo, hexdigest)) y estructura.
+
+    Lanza IntegrityError con el motivo; no hace nada si todo cuadra.
+    """
+    if expected is not None and hasher is not None:
+        algo, digest = expected
+        got = hasher.hexdigest(algo)
+        if got != digest:
+            raise IntegrityError(f"{algo} {got} != publicado {digest}")
+    problem = check_structure(path, name)
+    if problem:
+        raise IntegrityError(problem)
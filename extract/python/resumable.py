@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Estado persistente (SQLite) y utilidades de reanudación para `downloader.py`.
+
+Cada URL tiene una fila en el archivo de estado (por defecto
+`<outdir>/.download_state.sqlite`) con su estado, tamaño, bytes
+descargados y sha256. Tras un fallo transitorio la descarga continúa desde
+el final del `.part` en lugar de empezar de cero, y en una nueva ejecución
+las URLs completas (archivo presente con el tamaño registrado) se saltan sin
+tocar la red.
+"""
+
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit
+
+STATE_FILE = ".download_state.sqlite"
+CHUNK = 8 * 1024 * 1024  # bytes por lectura al rehashear un .part
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    url        TEXT PRIMARY KEY,
+    path       TEXT NOT NULL,
+    status     TEXT NOT NULL,   -- pending | partial | complete | failed
+    size       INTEGER,         -- tamaño esperado (NULL si el servidor no lo da)
+    bytes_done INTEGER NOT NULL DEFAULT 0,
+    sha256     TEXT,
+    error      TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class DownloadState:
+    """Estado por URL en SQLite; seguro entre hilos (una conexión con lock)."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def get(self, url):
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT url, path, status, size, bytes_done, sha256, error FROM downloads WHERE url = ?",
+                (url,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip(["url", "path", "status", "size", "bytes_done", "sha256", "error"], row))
+
+    def update(self, url, path, status, **fields):
+        """Inserta o actualiza la fila de `url` (solo las columnas dadas)."""
+        cols = dict(path=str(path), status=status, updated_at=time.time(), **fields)
+        names = ", ".join(cols)
+        marks = ", ".join("?" for _ in cols)
+        sets = ", ".join(f"{c} = excluded.{c}" for c in cols)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO downloads (url, {names}) VALUES (?, {marks}) "
+                f"ON CONFLICT(url) DO UPDATE SET {sets}",
+                (url, *cols.values()))
+            self._conn.commit()
+
+    def summary(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM downloads GROUP BY status"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def fname(url: str) -> str:
+    name = urlsplit(url).path.rsplit("/", 1)[-1].split("?", 1)[0]
+    return name or "download.bin"
+
+
+def diagnose_auth_issue(e: Exception) -> str:
+    msg = str(e)
+    # pistas típicas cuando falta autorización URS o cookies válidas
+    if "403" in msg or "401" in msg or "Forbidden" in msg or "Unauthorized" in msg:
+        return ("Falta autorizar la aplicación/endpoint en Earthdata (URS). "
+                "Abre la URL en el navegador autenticado y pulsa 'Authorize'.")
+    return msg
+
+
+def hash_prefix(path: Path, n_bytes: int, h=None):
+    """Hash (sha256 por defecto) de los primeros `n_bytes` de un `.part`, para seguir hasheando al reanudar."""
+    h = h if h is not None else hashlib.sha256()
+    with open(path, "rb") as fh:
+        remaining = n_bytes
+        while remaining > 0:
+            data = fh.read(min(CHUNK, remaining))
+            if not data:
+                break
+            h.update(data)
+            remaining -= len(data)
+    return h
+
+
+def is_complete(state, url: str, dest: Path) -> bool:
+    """True si el estado marca la URL como completa y el archivo sigue ahí con su tamaño."""
+    row = state.get(url)
+    return (row is not None and row["status"] == "complete" and dest.exists()
+            and (row["size"] is None or dest.stat().st_size == row["size"]))
@@ -0,0 +1,148 @@
+import gzip
+import io
+import json
+import os
+import zipfile
+from datetime import date
+
+import pytest
+
+import eke
+
+NC = b"CDF\x01" + b"\x00" * 28  # enough for check_structure (NetCDF classic header)
+
+
+class FakeJob:
+    """CADS-like Remote: `status` is read on every poll, `download` writes a zip of daily files."""
+
+    def __init__(self, server, request_id, request):
+        self.server, self.request_id, self.request = server, request_id, request
+        self.polls = 0
+
+    @property
+    def status(self):
+        if self.request_id in self.server.expired:
+            return "deleted"
+        self.polls += 1
+        return "running" if self.polls < 2 else "successful"
+
+    def download(self, target):
+        year, month = int(self.request["year"][0]), int(self.request["month"][0])
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            for d in self.request["day"]:
+                zf.writestr(f"dt_global_allsat_phy_l4_{year}{month:02d}{d}_20190101.nc", NC)
+        with open(target, "wb") as fh:
+            fh.write(buf.getvalue())
+
+
+class FakeServer:
+    def __init__(self):
+        self.jobs, self.expired, self.submitted = {}, set(), []
+
+    def get_remote(self, request_id):
+        return self.jobs.get(request_id) or FakeJob(self, request_id, None)
+
+
+class FakeClient:
+    def __init__(self):
+        self.client = FakeServer()
+
+    def retrieve(self, dataset, request):
+        server = self.client
+        job = FakeJob(server, f"job-{len(server.submitted)}", request)
+        server.jobs[job.request_id] = job
+        server.submitted.append(job.request_id)
+        return job
+
+
+@pytest.fixture
+def outdir(tmp_path):
+    """2014 on disk except 3-5 January and 10 February."""
+    missing = {date(2014, 1, 3), date(2014, 1, 4), date(2014, 1, 5), date(2014, 2, 10)}
+    day = date(2014, 1, 1)
+    while day.year == 2014:
+        if day not in missing:
+            with open(eke.day_file(day, str(tmp_path)), "wb") as fh:
+                fh.write(NC)
+        day = date.fromordinal(day.toordinal() + 1)
+    return str(tmp_path)
+
+
+def read_jobs(outdir):
+    with open(os.path.join(outdir, eke.JOBS_FILE), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def test_plan_only_missing_days(outdir):
+    assert eke.plan_requests([2014], outdir) == [(2014, 1, [3, 4, 5]), (2014, 2, [10])]
+
+
+def test_archive_under_nc_name_is_kept(outdir):
+    """Old downloads: a CDS ZIP (or GZIP) saved as the day's .nc is not requested again."""
+    for day, pack in ((date(2014, 1, 3), "zip"), (date(2014, 1, 4), "gzip")):
+        path = eke.day_file(day, outdir)
+        if pack == "zip":
+            with zipfile.ZipFile(path, "w") as zf:
+                zf.writestr("dt_global_allsat_phy_l4_20140103_20190101.nc", NC)
+        else:
+            with gzip.open(path, "wb") as fh:
+                fh.write(NC)
+    with zipfile.ZipFile(eke.day_file(date(2014, 1, 5), outdir), "w") as zf:
+        zf.writestr("readme.txt", b"no netcdf here")
+    assert eke.plan_requests([2014], outdir) == [(2014, 1, [5]), (2014, 2, [10])]
+
+
+def test_submit_downloads_and_clears_jobs(outdir):
+    client = FakeClient()
+    failures = eke.run(client, [2014], outdir, poll_seconds=0)
+    assert failures == {}
+    assert len(client.client.submitted) == 2
+    assert os.path.exists(eke.day_file(date(2014, 2, 10), outdir))
+    assert eke.plan_requests([2014], outdir) == []
+    assert read_jobs(outdir) == {}
+
+
+def test_resume_reuses_saved_job(outdir):
+    client = FakeClient()
+    job = client.retrieve(eke.DATASET, eke.build_request(2014, 1, [3, 4, 5]))
+    eke.save_jobs(os.path.join(outdir, eke.JOBS_FILE), {
+        "2014-01": {"request_id": job.request_id, "year": 2014, "month": 1, "days": [3, 4, 5]},
+        "2013-12": {"request_id": "job-old", "year": 2013, "month": 12, "days": [1]},  # nothing missing
+    })
+    failures = eke.run(client, [2014], outdir, poll_seconds=0)
+    assert failures == {}
+    # January polled through the saved id; only February was submitted
+    assert client.client.submitted == [job.request_id, "job-1"]
+    assert job.polls >= 2
+    assert read_jobs(outdir) == {}
+
+
+def test_expired_job_is_resubmitted(outdir):
+    client = FakeClient()
+    client.client.expired.add("job-gone")
+    eke.save_jobs(os.path.join(outdir, eke.JOBS_FILE), {
+        "2014-01": {"request_id": "job-gone", "year": 2014, "month": 1, "days": [3, 4, 5]},
+    })
+    failures = eke.run(client, [2014], outdir, poll_seconds=0)
+    assert failures == {}
+    assert "job-gone" not in client.client.submitted
+    assert len(client.client.submitted) == 2
+    assert os.path.exists(eke.day_file(date(2014, 1, 4), outdir))
+    assert read_jobs(outdir) == {}
+
+
+def test_job_failed_this_run_is_not_retried(outdir):
+    client = FakeClient()
+    retrieve = client.retrieve
+
+    def failing(dataset, request):
+        job = retrieve(dataset, request)
+        client.client.expired.add(job.request_id)
+        return job
+
+    client.retrieve = failing
+    failures = eke.run(client, [2014], outdir, poll_seconds=0)
+    assert set(failures) == {"2014-01", "2014-02"}
+    assert len(client.client.submitted) == 2
+    assert read_jobs(outdir) == {}
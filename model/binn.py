@@ -1,8 +1,7 @@
 import math
-import numpy as np
+import time
 import torch
 import torch.nn as nn
-from torch.utils.data import Dataset, DataLoader
 from typing import Optional
 from config import BINN
 
@@ -10,15 +9,123 @@ def safe_logit(p: torch.Tensor, eps=1e-6):
     p = torch.clamp(p, eps, 1 - eps)
     return torch.log(p) - torch.log(1 - p)
 
-class TabularDS(Dataset):
-    def __init__(self, X, y, prior=None, weight=None):
-        self.X = torch.tensor(X, dtype=torch.float32)
-        self.y = torch.tensor(y, dtype=torch.float32).view(-1,1)
-        self.prior = torch.tensor(prior, dtype=torch.float32).view(-1,1) if prior is not None else None
-        self.weight = torch.tensor(weight, dtype=torch.float32).view(-1,1) if weight is not None else None
-    def __len__(self): return len(self.X)
-    def __getitem__(self, i):
-        return self.X[i], self.y[i], (self.prior[i] if self.prior is not None else None), (self.weight[i] if self.weight is not None else None)
+def rank_auc(scores: torch.Tensor, y: torch.Tensor) -> float:
+    """
+    ROC AUC por rangos (Mann-Whitney) en el device de `scores`: un sort y sumas.
+    Empates con rango medio (igual que sklearn); NaN si falta una de las clases.
+    """
+    s = scores.reshape(-1)
+    pos = y.reshape(-1) > 0.5
+    n_pos = int(pos.sum())
+    n_neg = s.numel() - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return float("nan")
+    s_sorted, order = torch.sort(s)
+    _, inverse, counts = torch.unique_consecutive(s_sorted, return_inverse=True, return_counts=True)
+    ends = torch.cumsum(counts, 0).double()
+    ranks = (ends - (counts.double() - 1) / 2)[inverse]  # rango medio (base 1) de cada grupo de empates
+    sum_pos = ranks[pos[order]].sum().item()
+    return (sum_pos - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+
+class HistogramAUC:
+    """
+    AUC aproximado en streaming: acumula un histograma por clase lote a lote
+    (sin guardar ni ordenar las predicciones).
+
+    Los bordes de los bins son cuantiles de los scores del primer lote (pasar
+    logits, y que ese lote sea representativo: p. ej. barajado), así que los
+    bins se adaptan aunque las predicciones se concentren en una banda
+    estrecha. Scores fuera del rango del primer lote caen en los bins
+    extremos. Los pares positivo/negativo dentro del mismo bin cuentan como
+    empate: el error es como mucho `max_error()` = Σ pos_b·neg_b / (2·P·N),
+    del orden de 1/(2·bins) si el primer lote es representativo.
+    """
+    SAMPLE = 1 << 20  # scores del primer lote usados para estimar los cuantiles
+
+    def __init__(self, bins=4096, device="cpu"):
+        self.bins = bins
+        self.device = device
+        self.edges = None
+        self.pos = self.neg = None
+
+    def _init_edges(self, s: torch.Tensor):
+        if s.numel() > self.SAMPLE:
+            s = s[torch.randint(s.numel(), (self.SAMPLE,), device=s.device)]
+        q = torch.linspace(0, 1, self.bins + 1, device=s.device, dtype=torch.float64)[1:-1]
+        # unique: scores repetidos (empates) no generan bins vacíos
+        self.edges = torch.unique(torch.quantile(s.double(), q))
+        n = self.edges.numel() + 1
+        self.pos = torch.zeros(n, dtype=torch.float64, device=self.device)
+        self.neg = torch.zeros(n, dtype=torch.float64, device=self.device)
+
+    def update(self, scores: torch.Tensor, y: torch.Tensor):
+        s = scores.reshape(-1).double()
+        if self.edges is None:
+            self._init_edges(s)
+        idx = torch.bucketize(s, self.edges)
+        pos = y.reshape(-1) > 0.5
+        n = self.edges.numel() + 1
+        self.pos += torch.bincount(idx[pos], minlength=n)
+        self.neg += torch.bincount(idx[~pos], minlength=n)
+
+    def compute(self) -> float:
+        if self.pos is None:
+            return float("nan")
+        n_pos, n_neg = self.pos.sum(), self.neg.sum()
+        if n_pos == 0 or n_neg == 0:
+            return float("nan")
+        neg_below = torch.cumsum(self.neg, 0) - self.neg
+        return ((self.pos * (neg_below + 0.5 * self.neg)).sum() / (n_pos * n_neg)).item()
+
+    def max_error(self) -> float:
+        """Cota del error frente al AUC exacto (pares que comparten bin)."""
+        if self.pos is None or self.pos.sum() == 0 or self.neg.sum() == 0:
+            return float("nan")
+        return ((self.pos * self.neg).sum() / (2 * self.pos.sum() * self.neg.sum())).item()
+
+class TensorBatches:
+    """
+    Lotes (X, y, prior, weight) cortados de tensores ya construidos, sin trabajo por fila.
+
+    Con shuffle, cada época hace un solo randperm y un gather de las filas; los
+    lotes son luego vistas contiguas (slices) de esos tensores. prior/weight
+    pueden ser None y se devuelven como None. pin_memory usa buffers en memoria
+    fijada para copiar los lotes a la GPU con non_blocking.
+    """
+    def __init__(self, X, y, prior=None, weight=None, batch_size=1024, shuffle=False,
+                 pin_memory=False, seed=None):
+        as_col = lambda a: torch.as_tensor(a, dtype=torch.float32).view(-1, 1) if a is not None else None
+        self.tensors = [torch.as_tensor(X, dtype=torch.float32), as_col(y), as_col(prior), as_col(weight)]
+        self.n = len(self.tensors[0])
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.gen = torch.Generator().manual_seed(seed) if seed is not None else None
+        self._buffers = None
+        if self.pin_memory and not shuffle:
+            self.tensors = [t.pin_memory() if t is not None else None for t in self.tensors]
+
+    def __len__(self):
+        return math.ceil(self.n / self.batch_size)
+
+    def _epoch_tensors(self):
+        if not self.shuffle:
+            return self.tensors
+        perm = torch.randperm(self.n, generator=self.gen)
+        if not self.pin_memory:
+            return [t[perm] if t is not None else None for t in self.tensors]
+        # gather directo a buffers fijados (se reservan una vez)
+        if self._buffers is None:
+            self._buffers = [torch.empty_like(t).pin_memory() if t is not None else None for t in self.tensors]
+        for t, buf in zip(self.tensors, self._buffers):
+            if t is not None:
+                torch.index_select(t, 0, perm, out=buf)
+        return self._buffers
+
+    def __iter__(self):
+        tensors = self._epoch_tensors()
+        for s in range(0, self.n, self.batch_size):
+            yield tuple(t[s:s + self.batch_size] if t is not None else None for t in tensors)
 
 class BINNNet(nn.Module):
     def __init__(self, in_dim, hidden=[128,64], prior_mode="add_logit", prior_scale=1.0):
@@ -50,31 +157,31 @@ def train_binn(Xtr, ytr, Xva, yva, prior_tr=None, prior_va=None, effort_tr=None,
     in_dim = in_dim or Xtr.shape[1]
     net = BINNNet(in_dim, BINN["hidden_sizes"], BINN["prior_mode"], BINN["prior_scale"]).to(device)
 
-    ds_tr = TabularDS(Xtr, ytr, prior_tr, effort_tr if BINN["use_effort_as_weight"] else None)
-    ds_va = TabularDS(Xva, yva, prior_va, effort_va if BINN["use_effort_as_weight"] else None)
-
-    dl_tr = DataLoader(ds_tr, batch_size=BINN["batch_size"], shuffle=True, drop_last=False)
-    dl_va = DataLoader(ds_va, batch_size=BINN["batch_size"], shuffle=False)
+    pin = BINN["pin_memory"] and str(device).startswith("cuda")
+    dl_tr = TensorBatches(Xtr, ytr, prior_tr, effort_tr if BINN["use_effort_as_weight"] else None,
+                          batch_size=BINN["batch_size"], shuffle=True, pin_memory=pin, seed=BINN["seed"])
+    # AUC por histograma: val barajado para que el primer lote (bordes de los bins) sea representativo
+    dl_va = TensorBatches(Xva, yva, prior_va, effort_va if BINN["use_effort_as_weight"] else None,
+                          batch_size=BINN["batch_size"], shuffle=BINN["val_auc"] == "histogram",
+                          pin_memory=pin, seed=BINN["seed"])
 
     opt = torch.optim.Adam(net.parameters(), lr=BINN["lr"], weight_decay=BINN["weight_decay"])
     bce = nn.BCEWithLogitsLoss(reduction="none")
 
     best = dict(auc=-1.0, state=None)
 
-    def batch_auc(logits, y):
-        with torch.no_grad():
-            p = torch.sigmoid(logits).cpu().numpy().ravel()
-            t = y.cpu().numpy().ravel()
-            if len(np.unique(t))<2: return np.nan
-            from sklearn.metrics import roc_auc_score
-            return roc_auc_score(t, p)
+    def sync():
+        # tiempos reales en GPU (las operaciones CUDA son asíncronas)
+        if str(device).startswith("cuda"):
+            torch.cuda.synchronize()
 
     for epoch in range(BINN["epochs"]):
+        t0 = time.perf_counter()
         net.train(); loss_sum=0.0
         for X, y, prior, w in dl_tr:
-            X, y = X.to(device), y.to(device)
-            prior = prior.to(device) if prior is not None else None
-            w = w.to(device) if w is not None else None
+            X, y = X.to(device, non_blocking=pin), y.to(device, non_blocking=pin)
+            prior = prior.to(device, non_blocking=pin) if prior is not None else None
+            w = w.to(device, non_blocking=pin) if w is not None else None
 
             logits = net(X, prior)
             loss_vec = bce(logits, y)
@@ -95,29 +202,38 @@ def train_binn(Xtr, ytr, Xva, yva, prior_tr=None, prior_va=None, effort_tr=None,
             opt.step()
             loss_sum += loss.item()
 
-        # valid
+        sync(); t1 = time.perf_counter()
+
+        # valid: AUC en el device (rangos exactos, o histograma en streaming)
         net.eval()
+        hist = HistogramAUC(BINN["auc_bins"], device) if BINN["val_auc"] == "histogram" else None
         logits_va = []
         y_va_all = []
         with torch.no_grad():
             for X, y, prior, _ in dl_va:
-                X, y = X.to(device), y.to(device)
-                prior = prior.to(device) if prior is not None else None
+                X, y = X.to(device, non_blocking=pin), y.to(device, non_blocking=pin)
+                prior = prior.to(device, non_blocking=pin) if prior is not None else None
                 logits = net(X, prior)
-                logits_va.append(logits.cpu())
-                y_va_all.append(y.cpu())
-        if len(logits_va):
-            logits_va = torch.cat(logits_va, dim=0)
-            y_va_all = torch.cat(y_va_all, dim=0)
-            auc = batch_auc(logits_va, y_va_all)
+                if hist is not None:
+                    hist.update(logits, y)
+                else:
+                    logits_va.append(logits)
+                    y_va_all.append(y)
+        sync(); t2 = time.perf_counter()
+        if hist is not None:
+            auc = hist.compute()
+        elif len(logits_va):
+            auc = rank_auc(torch.cat(logits_va, dim=0), torch.cat(y_va_all, dim=0))
         else:
-            auc = np.nan
+            auc = float("nan")
+        t3 = time.perf_counter()
 
-        if (auc is not np.nan) and (auc > best["auc"]):
+        if not math.isnan(auc) and auc > best["auc"]:
             best["auc"] = auc
             best["state"] = {k:v.cpu() for k,v in net.state_dict().items()}
 
-        print(f"[BINN] Epoch {epoch+1}/{BINN['epochs']} loss={loss_sum/len(dl_tr):.4f} valAUC={auc:.4f}")
+        print(f"[BINN] Epoch {epoch+1}/{BINN['epochs']} loss={loss_sum/len(dl_tr):.4f} valAUC={auc:.4f} "
+              f"(train {t1-t0:.2f}s, val {t2-t1:.2f}s, auc {t3-t2:.3f}s)")
 
     if best["state"] is not None:
         net.load_state_dict(best["state"])
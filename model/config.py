@@ -10,6 +10,8 @@ MODEL_DIR.mkdir(parents=True, exist_ok=True)
 
 # Dataset final integrado (ONE BIG TABLE)
 FINAL_TABLE = DATA_DIR / "example_obt_env_tag.csv"
+# Misma tabla en Parquet particionado por species= (filas ordenadas por time_bin); si existe se usa en lugar del CSV
+FINAL_DATASET = DATA_DIR / "obt.parquet"
 
 # Claves
 KEYS = ["lat", "lon", "time_bin"]
@@ -43,7 +45,8 @@ MAXENT = dict(
     background_size=20000,
     penalty_l1=0.0,
     penalty_l2=1.0,
-    class_weight=None
+    class_weight=None,
+    standardize=False         # opcional: escala features con el pipeline ajustado en train (cambia resultados)
 )
 
 # BINN (PyTorch)
@@ -57,7 +60,11 @@ BINN = dict(
     prior_mode="add_logit",   # "add_logit" | "feature" | "none"
     prior_scale=1.0,
     lambda_prior_reg=0.0,
-    use_effort_as_weight=True
+    use_effort_as_weight=True,
+    pin_memory=True,          # lotes en memoria fijada (solo con device cuda)
+    val_auc="rank",           # "rank" (exacto, ordena en el device) | "histogram" (streaming, validaciones enormes)
+    auc_bins=4096,            # bins del AUC por histograma
+    standardize=False         # opcional: escala features con el pipeline ajustado en train (cambia resultados)
 )
 
 # Split train/val
@@ -69,3 +76,6 @@ SPLIT = dict(
 
 # Salidas (todo a ./model)
 OUT_DIR = MODEL_DIR
+# Caché de matrices de features (memmap float32) compartida por train_maxent / train_binn / predict
+FEATURE_STORE_DIR = MODEL_DIR / "feature_store"
+FEATURE_STORE_MAX_GB = 20  # al pasarse, se borran las entradas usadas hace más tiempo
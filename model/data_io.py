@@ -1,21 +1,137 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
 from pathlib import Path
-from config import FINAL_TABLE, LABEL_COL, SPECIES_COL, KEYS, AUTO_LABEL
+from typing import Iterable, Optional
+from config import (FINAL_TABLE, FINAL_DATASET, LABEL_COL, SPECIES_COL, KEYS, AUTO_LABEL,
+                    ENV_COLS_RAW, ENV_COLS_Z, TAG_COLS, PRIOR_COLS)
 
-def load_final_table(path: Path = FINAL_TABLE) -> pd.DataFrame:
-    df = pd.read_csv(path)
+# Esquema explícito de la OBT: variables en float32 (la mitad de memoria que float64)
+FLOAT_COLS = ENV_COLS_RAW + ENV_COLS_Z + TAG_COLS + PRIOR_COLS
+OBT_TYPES = {
+    "lat": pa.float64(), "lon": pa.float64(), "time_bin": pa.timestamp("ms"),
+    SPECIES_COL: pa.string(), LABEL_COL: pa.int8(),
+    **{c: pa.float32() for c in FLOAT_COLS},
+}
+# Dataset Parquet escrito por write_final_dataset: species=<sp>/, filas ordenadas por time_bin
+# en row groups de ROW_GROUP_ROWS (las estadísticas min/max permiten saltar por fecha)
+PARTITIONING = ds.partitioning(pa.schema([(SPECIES_COL, pa.string())]), flavor="hive")
+ROW_GROUP_ROWS = 65_536
+AUTO_LABEL_COLS = ["odba", "speed_ms", "depth_m"]
+
+def _as_list(v):
+    return None if v is None else ([v] if isinstance(v, str) else list(v))
+
+def _open_dataset(path: Path):
+    """Dataset Arrow para Parquet (archivo o directorio particionado) o Arrow IPC/Feather."""
+    if path.suffix in (".arrow", ".feather", ".ipc"):
+        return ds.dataset(path, format="ipc")
+    if path.is_dir():
+        # Cualquier particionado hive (species=, time_bin=YYYY-MM-DD, ...)
+        return ds.dataset(path, format="parquet", partitioning="hive")
+    return ds.dataset(path, format="parquet")
+
+def _filter(schema: pa.Schema, species=None, start=None, end=None):
+    """Expresión de filtro (species en lista, start <= time_bin <= end) para empujar al lector."""
+    expr = None
+    def _and(e):
+        return e if expr is None else expr & e
+    if species is not None and SPECIES_COL in schema.names:
+        expr = _and(ds.field(SPECIES_COL).isin(species))
+    if "time_bin" in schema.names:
+        t = schema.field("time_bin").type
+        if pa.types.is_date(t):
+            conv = lambda v: pd.Timestamp(v).date()
+        elif pa.types.is_string(t):  # partición time_bin=YYYY-MM-DD: ISO se ordena como texto
+            conv = lambda v: pd.Timestamp(v).strftime("%Y-%m-%d")
+        else:
+            conv = lambda v: pd.Timestamp(v).to_pydatetime()
+        if start is not None:
+            expr = _and(ds.field("time_bin") >= pa.scalar(conv(start), type=t))
+        if end is not None:
+            expr = _and(ds.field("time_bin") <= pa.scalar(conv(end), type=t))
+    return expr
+
+def _csv_header(path: Path):
+    with open(path, "r", encoding="utf-8") as fh:
+        return fh.readline().strip().split(",")
+
+def _read_csv(path: Path, columns, species=None, start=None, end=None) -> pa.Table:
+    """CSV con tipos explícitos y solo las columnas pedidas; los filtros se aplican en Arrow."""
+    include = [c for c in _csv_header(path) if columns is None or c in columns]
+    types = {c: t for c, t in OBT_TYPES.items() if c in include}
+    table = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(
+        include_columns=include, column_types=types))
+    expr = _filter(table.schema, species, start, end)
+    return table.filter(expr) if expr is not None else table
+
+def load_final_table(path: Optional[Path] = None, columns: Optional[Iterable[str]] = None,
+                     species=None, start=None, end=None) -> pd.DataFrame:
+    """
+    Carga la OBT con tipos explícitos (float32 en variables, species categórica).
+
+    path: CSV, Parquet (archivo o dataset hive, p. ej. el de write_final_dataset por species=) o
+    Arrow IPC; por defecto FINAL_DATASET si existe, si no FINAL_TABLE.
+    columns: proyección; se añaden siempre KEYS, species y label (o las
+    columnas del auto-etiquetado si no hay label). species/start/end se
+    empujan al lector Parquet (particiones y row groups que no cumplen no
+    se leen). Ojo: sin label, el auto-etiquetado usa los cuantiles de las
+    filas cargadas.
+    """
+    if path is None:
+        path = FINAL_DATASET if FINAL_DATASET.exists() else FINAL_TABLE
+    path = Path(path)
+    species = _as_list(species)
+
+    if path.suffix == ".csv":
+        dataset, available = None, _csv_header(path)
+    else:
+        dataset = _open_dataset(path)
+        available = dataset.schema.names
+
+    if columns is not None:
+        needed = list(KEYS) + [SPECIES_COL, LABEL_COL] + list(columns)
+        if LABEL_COL not in available:
+            needed += AUTO_LABEL_COLS
+        columns = [c for c in available if c in set(needed)]
+
+    if dataset is None:
+        table = _read_csv(path, columns, species, start, end)
+    else:
+        table = dataset.to_table(columns=columns, filter=_filter(dataset.schema, species, start, end))
+        table = table.cast(pa.schema([pa.field(f.name, OBT_TYPES.get(f.name, f.type)) for f in table.schema]))
+
+    df = table.to_pandas(ignore_metadata=True)
     # Normaliza tipos
     if "time_bin" in df.columns:
         df["time_bin"] = pd.to_datetime(df["time_bin"])
     # Asegura species
     if SPECIES_COL not in df.columns:
         df[SPECIES_COL] = "unknown"
+    df[SPECIES_COL] = df[SPECIES_COL].astype("category")
     # Auto-etiquetado si no hay label
     if LABEL_COL not in df.columns and AUTO_LABEL["enable"]:
         df[LABEL_COL] = auto_label(df, **AUTO_LABEL)
     return df
 
+def write_final_dataset(df: pd.DataFrame, path: Path = FINAL_DATASET):
+    """
+    Escribe la OBT como Parquet particionado por species=, ordenado por time_bin.
+
+    Una partición por día y especie daría miles de archivos pequeños; con
+    las filas ordenadas, los filtros de fecha saltan row groups enteros.
+    """
+    df = df.copy()
+    df[SPECIES_COL] = df[SPECIES_COL].astype(str) if SPECIES_COL in df.columns else "unknown"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.cast(pa.schema([pa.field(f.name, OBT_TYPES.get(f.name, f.type)) for f in table.schema]))
+    table = table.sort_by([(SPECIES_COL, "ascending"), ("time_bin", "ascending")])
+    ds.write_dataset(table, path, format="parquet", partitioning=PARTITIONING,
+                     min_rows_per_group=ROW_GROUP_ROWS, max_rows_per_group=ROW_GROUP_ROWS,
+                     existing_data_behavior="delete_matching")
+
 def auto_label(df: pd.DataFrame, odba_q=0.75, min_speed=0.1, max_depth=400.0, **kwargs) -> np.ndarray:
     """Heurística simple (ajústala a tu caso):
        foraging ≈ alta actividad (ODBA), velocidad > umbral, profundidad moderada."""
@@ -48,3 +164,9 @@ def train_val_split(df: pd.DataFrame, method="time", val_frac=0.2, time_val_quan
         train_df = df[mask].copy()
         val_df   = df[~mask].copy()
     return train_df, val_df
+
+if __name__ == "__main__":
+    # Convierte la OBT CSV al dataset Parquet particionado
+    df = load_final_table(FINAL_TABLE)
+    write_final_dataset(df, FINAL_DATASET)
+    print(f"OBT en Parquet: {FINAL_DATASET} ({len(df)} filas)")
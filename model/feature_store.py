@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Tuple
+from config import FEATURE_STORE_DIR, FEATURE_STORE_MAX_GB, KEYS, SPECIES_COL
+from features import feature_columns, impute_medians
+
+class FeatureStore:
+    """
+    Caché en disco de matrices de features, compartida por train_maxent, train_binn y predict.
+
+    Por (contenido de la OBT, configuración de features, especie) se guarda una
+    matriz float32 memory-mapped con todas las filas de la especie (inf → NaN,
+    sin imputar) más un JSON con columnas, medianas de imputación y columnas
+    con NaN. Los subconjuntos (presencias/background, train/val, lotes de
+    predicción) se sacan por índice de fila y se imputan al leer, así que
+    reentrenar con otros hiperparámetros no reconstruye features.
+
+    La huella del contenido se calcula aquí, solo de las columnas clave y de
+    features que se usan (una vez por columna) más el índice de filas, con
+    el que se sirven los subconjuntos; así no se encarece la carga de la OBT
+    a quien no usa la caché.
+
+    La carpeta se limita a `max_gb`: tras guardar una entrada se borran las
+    usadas hace más tiempo (cada carga renueva su fecha).
+    """
+
+    def __init__(self, df: pd.DataFrame, store_dir: Path = FEATURE_STORE_DIR,
+                 max_gb: float = FEATURE_STORE_MAX_GB):
+        self.df = df
+        self.dir = Path(store_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_gb * 1024 ** 3
+        self._hashes = {}
+        self._index_hash = None
+        self._open = {}
+
+    def column_hash(self, col: str) -> str:
+        """sha1 de los valores de una columna en orden de filas (memoizado)."""
+        if col not in self._hashes:
+            h = pd.util.hash_pandas_object(self.df[col], index=False).to_numpy()
+            self._hashes[col] = hashlib.sha1(h.tobytes()).hexdigest()
+        return self._hashes[col]
+
+    def index_hash(self) -> str:
+        """sha1 del índice de filas: mismos valores con otro índice son otra entrada (memoizado)."""
+        if self._index_hash is None:
+            h = pd.util.hash_pandas_object(self.df.index.to_series(), index=False).to_numpy()
+            self._index_hash = hashlib.sha1(h.tobytes()).hexdigest()
+        return self._index_hash
+
+    def key(self, species, feature_cfg: Dict) -> str:
+        cols = [c for c in feature_columns(**feature_cfg) if c in self.df.columns]
+        ident = {
+            "columns": {c: self.column_hash(c) for c in list(KEYS) + [SPECIES_COL] + cols},
+            "index": self.index_hash(),
+            "feature_cfg": feature_cfg,
+            "species": str(species),
+        }
+        return hashlib.sha1(json.dumps(ident, sort_keys=True).encode()).hexdigest()
+
+    def _build(self, species, feature_cfg: Dict, key: str):
+        d = self.df[self.df[SPECIES_COL] == species]
+        cols = [c for c in feature_columns(**feature_cfg) if c in d.columns]
+        medians = impute_medians(d, cols)
+
+        # Escribe a .tmp y renombra: una ejecución interrumpida no deja entradas a medias
+        tmp = self.dir / f"{key}.tmp.npy"
+        X = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(d), len(cols)))
+        nan_cols = []
+        for j, c in enumerate(cols):
+            v = d[c].to_numpy(dtype=np.float32, na_value=np.nan)
+            v[~np.isfinite(v)] = np.nan
+            X[:, j] = v
+            if np.isnan(v).any():
+                nan_cols.append(c)
+        X.flush(); del X
+        np.save(self.dir / f"{key}.index.npy", d.index.to_numpy())
+        with open(self.dir / f"{key}.json", "w", encoding="utf-8") as fh:
+            json.dump(dict(species=str(species), feature_cfg=feature_cfg, cols=cols,
+                           medians=medians, nan_cols=nan_cols, n_rows=len(d)), fh, indent=1)
+        os.replace(tmp, self.dir / f"{key}.npy")
+        print(f"[FEATURES] {species}: matriz {len(d)}x{len(cols)} guardada en caché ({key[:12]})")
+        self.prune(keep=key)
+
+    def prune(self, keep: str = None):
+        """Borra las entradas usadas hace más tiempo (fecha del .json) hasta quedar bajo `max_bytes`."""
+        entries = {}
+        for p in self.dir.glob("*.json"):
+            k = p.stem
+            files = [p, self.dir / f"{k}.npy", self.dir / f"{k}.index.npy"]
+            entries[k] = (p.stat().st_mtime, files, sum(f.stat().st_size for f in files if f.exists()))
+        total = sum(e[2] for e in entries.values())
+        for k, (_, files, size) in sorted(entries.items(), key=lambda kv: kv[1][0]):
+            if total <= self.max_bytes:
+                break
+            if k == keep or k in self._open:
+                continue
+            for f in files:
+                f.unlink(missing_ok=True)
+            total -= size
+            print(f"[FEATURES] caché sobre {self.max_bytes / 1024 ** 3:g} GB: borrada la entrada {k[:12]}")
+
+    def load(self, species, feature_cfg: Dict):
+        """(memmap de solo lectura, índice de filas, metadatos) de la especie; la construye si falta."""
+        key = self.key(species, feature_cfg)
+        if key not in self._open:
+            if not (self.dir / f"{key}.npy").exists():
+                self._build(species, feature_cfg, key)
+            with open(self.dir / f"{key}.json", "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            os.utime(self.dir / f"{key}.json")  # marca de último uso para prune()
+            X = np.load(self.dir / f"{key}.npy", mmap_mode="r")
+            index = pd.Index(np.load(self.dir / f"{key}.index.npy"))
+            self._open[key] = (X, index, meta)
+        return self._open[key]
+
+    def rows(self, df_sub: pd.DataFrame, species, feature_cfg: Dict) -> Tuple[np.ndarray, List[str]]:
+        """(X float32 sin imputar, cols) de las filas de `df_sub` (subconjunto de la especie en la OBT de la caché)."""
+        X_all, index, meta = self.load(species, feature_cfg)
+        pos = index.get_indexer(df_sub.index)
+        if (pos < 0).any():
+            raise KeyError(f"Filas fuera de la caché de features de {species}")
+        return X_all[pos], meta["cols"]  # fancy indexing: copia en RAM, el memmap no se toca
+
+    def matrix(self, df_sub: pd.DataFrame, species, feature_cfg: Dict,
+               medians: Dict[str, float] = None) -> Tuple[np.ndarray, List[str]]:
+        """Como `rows`, imputando NaN con `medians` (por defecto las de todas las filas de la especie)."""
+        X, cols = self.rows(df_sub, species, feature_cfg)
+        meta = self.load(species, feature_cfg)[2]
+        medians = meta["medians"] if medians is None else medians
+        for c in meta["nan_cols"]:
+            v = X[:, cols.index(c)]
+            v[np.isnan(v)] = medians[c]
+        return X, cols
@@ -1,36 +1,126 @@
+import joblib
 import numpy as np
 import pandas as pd
+from pathlib import Path
 from sklearn.preprocessing import StandardScaler
-from typing import Tuple, List
+from typing import Dict, Tuple, List
 from config import ENV_COLS_RAW, ENV_COLS_Z, TAG_COLS, PRIOR_COLS, LABEL_COL, SPECIES_COL
 
-def build_feature_matrix(df: pd.DataFrame,
-                         use_env_raw=True, use_env_z=True,
-                         use_tag=True, use_priors=True) -> Tuple[np.ndarray, List[str]]:
+def feature_columns(use_env_raw=True, use_env_z=True, use_tag=True, use_priors=True) -> List[str]:
+    """Columnas que pide una configuración de features (para proyectar al cargar la OBT)."""
     cols = []
     if use_env_raw:
-        cols += [c for c in ENV_COLS_RAW if c in df.columns]
+        cols += ENV_COLS_RAW
     if use_env_z:
-        cols += [c for c in ENV_COLS_Z if c in df.columns]
+        cols += ENV_COLS_Z
     if use_tag:
-        cols += [c for c in TAG_COLS if c in df.columns]
+        cols += TAG_COLS
     if use_priors:
-        cols += [c for c in PRIOR_COLS if c in df.columns]
-    X = df[cols].astype(float).replace([np.inf, -np.inf], np.nan)
-    X = X.fillna(X.median(numeric_only=True))  # imputación simple
-    return X.values, cols
+        cols += PRIOR_COLS
+    return cols
+
+def impute_medians(df: pd.DataFrame, cols: List[str]) -> Dict[str, float]:
+    """Mediana de cada columna ignorando NaN/inf (NaN si la columna está vacía)."""
+    medians = {}
+    for c in cols:
+        v = df[c].to_numpy(dtype=np.float32, na_value=np.nan)
+        v = v[np.isfinite(v)]
+        medians[c] = float(np.median(v)) if v.size else float("nan")
+    return medians
+
+def fill_features(df: pd.DataFrame, cols: List[str], medians: Dict[str, float], out=None) -> np.ndarray:
+    """Matriz float32 (n, len(cols)) columna a columna: inf → NaN → mediana. `out` puede ser un memmap."""
+    X = np.empty((len(df), len(cols)), dtype=np.float32) if out is None else out
+    for j, c in enumerate(cols):
+        v = df[c].to_numpy(dtype=np.float32, na_value=np.nan)
+        v[~np.isfinite(v)] = medians[c]
+        X[:, j] = v
+    return X
+
+def build_feature_matrix(df: pd.DataFrame,
+                         use_env_raw=True, use_env_z=True,
+                         use_tag=True, use_priors=True) -> Tuple[np.ndarray, List[str]]:
+    cols = [c for c in feature_columns(use_env_raw, use_env_z, use_tag, use_priors) if c in df.columns]
+    X = fill_features(df, cols, impute_medians(df, cols))  # imputación simple
+    return X, cols
+
+class FeaturePipeline:
+    """
+    Preprocesado ajustado en train y reutilizado tal cual en validación/predicción.
+
+    Guarda el orden de columnas, las medianas de imputación y (si `standardize`)
+    un StandardScaler, todo estimado solo con las filas de entrenamiento. Las
+    columnas `passthrough` (p. ej. Effort como peso) se imputan pero no se escalan.
+    `transform` no depende del lote, así que predecir por trozos da lo mismo que de una vez.
+    """
+
+    def __init__(self, cols: List[str], standardize=True, passthrough=()):
+        self.cols = list(cols)
+        self.standardize = standardize
+        self.passthrough = [c for c in passthrough if c in self.cols]
+        self.medians = None
+        self.scaler = None
+
+    def fit(self, X: np.ndarray, cols: List[str]):
+        """Ajusta con una matriz cruda (NaN/inf sin imputar) cuyas columnas son `cols`."""
+        X = self._select(X, cols)
+        med = np.array([np.median(v[np.isfinite(v)]) if np.isfinite(v).any() else np.nan for v in X.T],
+                       dtype=np.float32)
+        self.medians = dict(zip(self.cols, med.tolist()))
+        self._med = med
+        if self.standardize:
+            self.scaler = StandardScaler().fit(np.where(np.isfinite(X), X, med))
+            # las columnas passthrough quedan sin escalar
+            keep = np.array([c in self.passthrough for c in self.cols])
+            self.scaler.mean_[keep] = 0.0
+            self.scaler.scale_[keep] = 1.0
+        return self
+
+    def transform(self, X: np.ndarray, cols: List[str]) -> np.ndarray:
+        """Reordena a `self.cols`, imputa y escala en una sola pasada vectorizada (float32)."""
+        X = self._select(X, cols)
+        X = np.where(np.isfinite(X), X, self._med)
+        if self.scaler is not None:
+            X = (X - self.scaler.mean_.astype(np.float32)) / self.scaler.scale_.astype(np.float32)
+        return X.astype(np.float32, copy=False)
+
+    def fit_transform(self, X: np.ndarray, cols: List[str]) -> np.ndarray:
+        return self.fit(X, cols).transform(X, cols)
+
+    def transform_frame(self, df: pd.DataFrame) -> np.ndarray:
+        """Como `transform`, leyendo las columnas directamente de un DataFrame."""
+        return self.transform(df[self.cols].to_numpy(dtype=np.float32, na_value=np.nan), self.cols)
+
+    def _select(self, X, cols):
+        if list(cols) == self.cols:
+            return np.asarray(X, dtype=np.float32)
+        missing = [c for c in self.cols if c not in cols]
+        if missing:
+            raise ValueError(f"Faltan columnas del pipeline de features: {missing}")
+        return np.asarray(X, dtype=np.float32)[:, [list(cols).index(c) for c in self.cols]]
 
 def standardize_per_species(train_df, val_df, feature_cols):
+    """Ajusta un FeaturePipeline por especie en train y lo aplica a train y val (in situ)."""
     scalers = {}
     for sp in train_df[SPECIES_COL].unique():
-        scalers[sp] = StandardScaler()
         idx = train_df[SPECIES_COL] == sp
-        train_df.loc[idx, feature_cols] = scalers[sp].fit_transform(train_df.loc[idx, feature_cols].astype(float))
-        # aplica a val con el mismo scaler
+        scalers[sp] = FeaturePipeline(feature_cols)
+        X = train_df.loc[idx, feature_cols].to_numpy(dtype=np.float32, na_value=np.nan)
+        train_df.loc[idx, feature_cols] = scalers[sp].fit_transform(X, feature_cols)
+        # aplica a val con el mismo pipeline
         idxv = val_df[SPECIES_COL] == sp
-        val_df.loc[idxv, feature_cols] = scalers[sp].transform(val_df.loc[idxv, feature_cols].astype(float))
+        val_df.loc[idxv, feature_cols] = scalers[sp].transform_frame(val_df.loc[idxv])
     return train_df, val_df, scalers
 
+def pipeline_path(model_path: Path) -> Path:
+    """FeaturePipeline guardado junto a un modelo: maxent_{sp}.joblib → maxent_{sp}.features.joblib."""
+    return Path(model_path).with_suffix(".features.joblib")
+
+def load_pipeline(model_path: Path):
+    """FeaturePipeline de un modelo, o None si se entrenó sin él (artefactos antiguos)."""
+    path = pipeline_path(model_path)
+    return joblib.load(path) if path.exists() else None
+
 def get_Xy(df: pd.DataFrame, cols: List[str]):
     X = df[cols].astype(float).values
     y = df[LABEL_COL].astype(int).values
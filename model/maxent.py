@@ -3,19 +3,24 @@ import pandas as pd
 from typing import Dict, Tuple
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import roc_auc_score
-from features import build_feature_matrix
+from features import build_feature_matrix, FeaturePipeline
+from feature_store import FeatureStore
 from sampling import presence_background
 from config import MAXENT, SPECIES_COL
 
-def train_maxent_for_species(df: pd.DataFrame, species: str, feature_cfg: Dict):
+def train_maxent_for_species(df: pd.DataFrame, species: str, feature_cfg: Dict, store: FeatureStore = None):
     pres, back = presence_background(
         df, background_size=MAXENT["background_size"], species=species, use_effort_as_prob=True
     )
     pres = pres.copy(); pres["pb"] = 1
     back = back.copy(); back["pb"] = 0
-    d = pd.concat([pres, back], ignore_index=True)
+    d = pd.concat([pres, back])  # conserva el índice de df: localiza las filas en la caché
 
-    X, cols = build_feature_matrix(d, **feature_cfg)
+    # Medianas (y escala) ajustadas solo con las filas de entrenamiento
+    store = store or FeatureStore(df)
+    raw, cols = store.rows(d, species, feature_cfg)
+    pipe = FeaturePipeline(cols, standardize=MAXENT["standardize"])
+    X = pipe.fit_transform(raw, cols)
     y = d["pb"].values
 
     # Penalizaciones: C = 1 / (l2 + l1) aprox (sklearn no separa ambos en LogisticRegression)
@@ -37,10 +42,21 @@ def train_maxent_for_species(df: pd.DataFrame, species: str, feature_cfg: Dict):
     clf.fit(X, y)
     # AUC interno (hold-in)
     auc = roc_auc_score(y, clf.predict_proba(X)[:,1]) if len(np.unique(y))>1 else np.nan
-    return clf, cols, auc
+    return clf, cols, auc, pipe
 
-def predict_maxent(clf, cols, df: pd.DataFrame, feature_cfg: Dict) -> np.ndarray:
-    # Construye las mismas features; limita a las columnas usadas por MAXENT
-    _, all_cols = build_feature_matrix(df, **feature_cfg)  # para asegurar fillna
-    X = df[cols].astype(float).fillna(df[cols].median(numeric_only=True)).values
+def predict_maxent(clf, cols, df: pd.DataFrame, feature_cfg: Dict,
+                   store: FeatureStore = None, species=None, pipeline: FeaturePipeline = None) -> np.ndarray:
+    # Mismas features que en el entrenamiento (de la caché si hay store); limita a las columnas de MAXENT
+    if pipeline is not None:
+        # imputación/escala de train: no depende de las filas de este lote
+        if store is not None:
+            X_all = pipeline.transform(*store.rows(df, species, feature_cfg))
+        else:
+            X_all = pipeline.transform_frame(df)
+        all_cols = pipeline.cols
+    elif store is not None:
+        X_all, all_cols = store.matrix(df, species, feature_cfg)
+    else:
+        X_all, all_cols = build_feature_matrix(df, **feature_cfg)
+    X = X_all[:, [all_cols.index(c) for c in cols]]
     return clf.predict_proba(X)[:, 1]
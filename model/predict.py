@@ -7,7 +7,8 @@ from shapely.geometry import Polygon, MultiPolygon
 from shapely.ops import unary_union
 from config import OUT_DIR, SPECIES_COL
 from data_io import load_final_table, ensure_keys
-from features import build_feature_matrix
+from features import build_feature_matrix, feature_columns, load_pipeline
+from feature_store import FeatureStore
 from maxent import predict_maxent
 from utils import optimal_threshold
 
@@ -18,17 +19,26 @@ def load_binn(sp: str):
     obj = joblib.load(path)
     return obj["state"], obj["used_cols"]
 
-def pred_species(df_sp: pd.DataFrame, sp: str):
+def pred_species(df_sp: pd.DataFrame, sp: str, store: FeatureStore = None):
     # MAXENT prior prob
     maxent_path = OUT_DIR / f"maxent_{sp}.joblib"
     if maxent_path.exists():
         clf, cols, cfg = joblib.load(maxent_path)
-        prior = predict_maxent(clf, cols, df_sp, cfg)
+        prior = predict_maxent(clf, cols, df_sp, cfg, store, sp, load_pipeline(maxent_path))
     else:
         prior = df_sp["S_maxent"].fillna(0.5).values if "S_maxent" in df_sp.columns else np.full(len(df_sp),0.5)
 
-    # Build features and align to used_cols for BINN
-    X_all, cols_all = build_feature_matrix(df_sp, **FEATURE_CFG)
+    # Build features (from the feature store when given) and align to used_cols for BINN.
+    # With the training pipeline, imputation/scaling use train statistics, so any
+    # chunk of rows gets the same values it would get in a full-grid pass
+    pipe = load_pipeline(OUT_DIR / f"binn_{sp}.joblib")
+    if pipe is not None:
+        X_all = pipe.transform(*store.rows(df_sp, sp, FEATURE_CFG)) if store is not None else pipe.transform_frame(df_sp)
+        cols_all = pipe.cols
+    elif store is not None:
+        X_all, cols_all = store.matrix(df_sp, sp, FEATURE_CFG)
+    else:
+        X_all, cols_all = build_feature_matrix(df_sp, **FEATURE_CFG)
 
     # Drop Effort & S_maxent because BINN los recibe por fuera (add_logit + weights)
     drop_cols = [c for c in ["Effort", "S_maxent"] if c in cols_all]
@@ -51,15 +61,16 @@ def pred_species(df_sp: pd.DataFrame, sp: str):
     return p
 
 def main():
-    df = load_final_table()
+    df = load_final_table(columns=feature_columns(**FEATURE_CFG))
     df = ensure_keys(df)
+    store = FeatureStore(df)
 
     pred_rows = []
     species_list = sorted(df[SPECIES_COL].unique())
     for sp in species_list:
         d = df[df[SPECIES_COL]==sp].copy()
         if len(d)==0: continue
-        p = pred_species(d, sp)
+        p = pred_species(d, sp, store)
         pred_rows.append(pd.DataFrame({
             "lat": d["lat"].values,
             "lon": d["lon"].values,
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los módulos de model/ se importan entre sí directamente (`from config import ...`)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
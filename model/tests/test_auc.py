@@ -0,0 +1,68 @@
+import math
+
+import numpy as np
+import pytest
+import torch
+from sklearn.metrics import roc_auc_score
+
+from binn import HistogramAUC, rank_auc
+
+
+def cases():
+    rng = np.random.default_rng(0)
+    for n, pos_frac in [(50, 0.5), (2000, 0.3), (20000, 0.02)]:
+        y = (rng.random(n) < pos_frac).astype(int)
+        y[:2] = [0, 1]
+        yield "continuous", y, rng.normal(size=n) + y
+        yield "rounded (ties)", y, np.round(rng.normal(size=n) + y, 1)
+        yield "three levels", y, rng.integers(0, 3, n).astype(float) + y * rng.integers(0, 2, n)
+    y = np.array([0, 1, 0, 1])
+    yield "all tied", y, np.zeros(4)
+
+
+@pytest.mark.parametrize("name,y,s", list(cases()), ids=lambda v: v if isinstance(v, str) else "")
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_rank_auc_matches_sklearn(name, y, s, dtype):
+    scores = torch.tensor(s, dtype=dtype)
+    expected = roc_auc_score(y, scores.double().numpy())  # mismos valores que ve rank_auc
+    assert rank_auc(scores, torch.tensor(y, dtype=torch.float32)) == pytest.approx(expected, abs=1e-6)
+
+
+def test_rank_auc_single_class_is_nan():
+    assert math.isnan(rank_auc(torch.randn(10), torch.ones(10)))
+    assert math.isnan(rank_auc(torch.randn(10), torch.zeros(10)))
+
+
+def clustered(n=200_000, seed=1):
+    """Presencia/fondo desbalanceado con probabilidades en una banda estrecha (todas ≈ 0.057)."""
+    rng = np.random.default_rng(seed)
+    y = (rng.random(n) < 0.03).astype(int)
+    logits = -2.8 + 0.005 * rng.normal(size=n) + 0.003 * y
+    return y, logits
+
+
+@pytest.mark.parametrize("batch", [1024, 50_000])
+def test_histogram_auc_streaming_close_to_exact(batch):
+    y, logits = clustered()
+    exact = roc_auc_score(y, logits)
+    hist = HistogramAUC(bins=4096)
+    perm = np.random.default_rng(2).permutation(len(y))  # primer lote representativo
+    for i in range(0, len(y), batch):
+        sl = perm[i:i + batch]
+        hist.update(torch.tensor(logits[sl]), torch.tensor(y[sl]))
+    got = hist.compute()
+    assert abs(got - exact) <= hist.max_error() + 1e-9
+    assert abs(got - exact) < 2e-3
+
+
+def test_histogram_auc_ties_and_single_class():
+    y = np.array([0, 1, 0, 1, 1, 0])
+    s = np.array([0.0, 0.0, 1.0, 1.0, 2.0, -1.0])
+    hist = HistogramAUC(bins=16)
+    hist.update(torch.tensor(s), torch.tensor(y))
+    assert hist.compute() == pytest.approx(roc_auc_score(y, s), abs=1e-12)
+
+    empty = HistogramAUC()
+    assert math.isnan(empty.compute())
+    empty.update(torch.randn(5), torch.zeros(5))
+    assert math.isnan(empty.compute())
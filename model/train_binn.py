@@ -3,16 +3,17 @@ import numpy as np
 import pandas as pd
 from pathlib import Path
 from sklearn.metrics import roc_auc_score
-from config import OUT_DIR, SPECIES_COL, PRIOR_COLS, SPLIT
+from config import OUT_DIR, SPECIES_COL, PRIOR_COLS, SPLIT, BINN
 from data_io import load_final_table, ensure_keys, train_val_split
-from features import build_feature_matrix, get_Xy
+from features import get_Xy, feature_columns, FeaturePipeline, pipeline_path, load_pipeline
+from feature_store import FeatureStore
 from maxent import predict_maxent
 from binn import train_binn
 from utils import optimal_threshold
 
 FEATURE_CFG = dict(use_env_raw=True, use_env_z=True, use_tag=True, use_priors=True)  # incluye Effort, S_maxent
 
-def load_maxent_prior_prob(df_sp: pd.DataFrame, sp: str) -> np.ndarray:
+def load_maxent_prior_prob(df_sp: pd.DataFrame, sp: str, store: FeatureStore = None) -> np.ndarray:
     path = OUT_DIR / f"maxent_{sp}.joblib"
     if not path.exists():
         # Si no existe MAXENT para la especie, usa S_maxent si está; si no, 0.5
@@ -20,12 +21,13 @@ def load_maxent_prior_prob(df_sp: pd.DataFrame, sp: str) -> np.ndarray:
             return df_sp["S_maxent"].fillna(0.5).values
         return np.full(len(df_sp), 0.5)
     clf, cols, cfg = joblib.load(path)
-    p = predict_maxent(clf, cols, df_sp, cfg)
+    p = predict_maxent(clf, cols, df_sp, cfg, store, sp, load_pipeline(path))
     return p
 
 def main():
-    df = load_final_table()
+    df = load_final_table(columns=feature_columns(**FEATURE_CFG))
     df = ensure_keys(df)
+    store = FeatureStore(df)
 
     # Split (por tiempo o random)
     train_df, val_df = train_val_split(df, **SPLIT)
@@ -39,9 +41,14 @@ def main():
             print(f"[BINN] {sp}: pocos datos, se omite.")
             continue
 
-        # Construye features completas (incluye PRIOR_COLS para esfuerzo/peso)
-        Xtr_all, cols_all = build_feature_matrix(tr, **FEATURE_CFG)
-        Xva_all, _ = build_feature_matrix(va, **FEATURE_CFG)
+        # Features completas desde la caché (incluye PRIOR_COLS para esfuerzo/peso).
+        # Imputación y escala se ajustan solo con train y se aplican igual a val;
+        # Effort/S_maxent se imputan pero no se escalan (peso y prior externos)
+        Xtr_raw, cols_all = store.rows(tr, sp, FEATURE_CFG)
+        Xva_raw, _ = store.rows(va, sp, FEATURE_CFG)
+        pipe = FeaturePipeline(cols_all, standardize=BINN["standardize"], passthrough=PRIOR_COLS)
+        Xtr_all = pipe.fit_transform(Xtr_raw, cols_all)
+        Xva_all = pipe.transform(Xva_raw, cols_all)
 
         # Separa Effort (peso) si está
         def get_col(a, name):
@@ -53,8 +60,8 @@ def main():
         # S_maxent prior probabilístico:
         # - si existe MAXENT entrenado: usar su prob como prior_informado
         # - sino: usa columna S_maxent del dataset o 0.5
-        prior_tr = load_maxent_prior_prob(tr, sp)
-        prior_va = load_maxent_prior_prob(va, sp)
+        prior_tr = load_maxent_prior_prob(tr, sp, store)
+        prior_va = load_maxent_prior_prob(va, sp, store)
 
         # Quita columnas de PRIORS del vector X de la red (si usamos prior como logit add)
         # Mantén Effort como peso, no como feature (opcional)
@@ -95,6 +102,7 @@ def main():
             dict(state=net.state_dict(), used_cols=used_cols),
             OUT_DIR / f"binn_{sp}.joblib"
         )
+        joblib.dump(pipe, pipeline_path(OUT_DIR / f"binn_{sp}.joblib"))
         pd.DataFrame({
             "lat": va["lat"], "lon": va["lon"], "time_bin": va["time_bin"],
             "species": sp, "P_forage": pva
@@ -3,20 +3,24 @@ import pandas as pd
 from pathlib import Path
 from config import OUT_DIR, SPECIES_COL
 from data_io import load_final_table, ensure_keys, train_val_split
-from features import build_feature_matrix
+from features import build_feature_matrix, feature_columns, pipeline_path
+from feature_store import FeatureStore
 from maxent import train_maxent_for_species, predict_maxent
 
 FEATURE_CFG = dict(use_env_raw=True, use_env_z=True, use_tag=True, use_priors=False)
 
 def main():
-    df = load_final_table()
+    # Effort: probabilidad de muestreo del background
+    df = load_final_table(columns=feature_columns(**FEATURE_CFG) + ["Effort"])
     df = ensure_keys(df)
+    store = FeatureStore(df)
 
     species_list = sorted(df[SPECIES_COL].unique())
     results = []
     for sp in species_list:
-        clf, cols, auc = train_maxent_for_species(df, sp, FEATURE_CFG)
+        clf, cols, auc, pipe = train_maxent_for_species(df, sp, FEATURE_CFG, store)
         joblib.dump((clf, cols, FEATURE_CFG), OUT_DIR / f"maxent_{sp}.joblib")
+        joblib.dump(pipe, pipeline_path(OUT_DIR / f"maxent_{sp}.joblib"))
         results.append({"species": sp, "train_auc": auc})
         print(f"[MAXENT] {sp}: AUC_in={auc:.4f}, features={len(cols)}")
 
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from remote import is_remote, source_stat, fetched_bytes
+
+SEAFLOWER_BBOX = (-82.5, 11.5, -78.0, 16.5)  # (min_lon, min_lat, max_lon, max_lat)
+
+def add_batch_args(p: argparse.ArgumentParser):
+    """Common CLI flags for batch transforms."""
+    p.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                   help="Files processed in parallel (default: CPUs, 1 = serial)")
+    p.add_argument("--force", action="store_true",
+                   help="Reprocess files even if their outputs are newer than the input")
+    p.add_argument("--report", help="Write a JSON report (per-file results and failures) here")
+    return p
+
+def parse_bbox(value):
+    """Parse "min_lon,min_lat,max_lon,max_lat" (or "seaflower") into a tuple."""
+    if value is None:
+        return None
+    if value.lower() == "seaflower":
+        return SEAFLOWER_BBOX
+    return tuple(float(v) for v in value.split(","))
+
+def write_parquet(chunks, output_path, schema=None):
+    """
+    Stream DataFrame chunks into one Parquet file; returns the row count.
+
+    An input with no rows still gets a (zero-row) file with `schema`, so
+    skip-if-newer does not reprocess it on every run.
+    """
+    writer, n_rows = None, 0
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            n_rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table((schema or pa.schema([])).empty_table(), output_path)
+    return n_rows
+
+def is_up_to_date(src, outputs):
+    """True if every output exists and is newer than the input file (or remote object)."""
+    if not all(os.path.exists(o) for o in outputs):
+        return False
+    src_mtime = source_stat(src)[1]
+    return all(os.path.exists(o) and os.stat(o).st_mtime >= src_mtime for o in outputs)
+
+def _run_one(process_fn, outputs_fn, src):
+    """Run process_fn(src) and return a result record (never raises)."""
+    t0 = time.perf_counter()
+    record = dict(file=str(src), ok=True, rows=0, bytes=0, seconds=0.0)
+    fetched0 = fetched_bytes()
+    try:
+        # inside the try: a vanished or unreadable input is a failed record, not a dead pool task
+        record["bytes"] = source_stat(src)[0]
+        record["rows"] = int(process_fn(src) or 0)
+    except Exception as e:
+        record.update(ok=False, error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+        # A half-written output would look up to date on the next run
+        try:
+            for o in outputs_fn(src):
+                if os.path.exists(o):
+                    os.remove(o)
+        except Exception:
+            pass
+    record["seconds"] = time.perf_counter() - t0
+    if is_remote(src):
+        record["fetched"] = fetched_bytes() - fetched0  # bytes actually read from object storage
+    return record
+
+def _report(record):
+    name = os.path.basename(record["file"])
+    if record["ok"]:
+        print(f"✅ {name}: {record['rows']} rows in {record['seconds']:.1f} s")
+    else:
+        print(f"❌ {name}: {record['error']}", file=sys.stderr)
+    return record
+
+def run_batch(files, process_fn, outputs_fn, workers=1, force=False, report=None, label="batch"):
+    """
+    Process independent input files on a process pool.
+
+    process_fn(path) writes the outputs of one file and returns its row
+    count; outputs_fn(path) lists those outputs so files whose outputs are
+    newer than the input are skipped (unless `force`). Both must be
+    picklable (module-level functions or functools.partial of them).
+    Failures are collected with their traceback instead of stopping the
+    batch; a throughput summary is printed and the records are returned.
+    """
+    todo, records = [], []
+    for f in files:
+        try:
+            if force or not is_up_to_date(f, outputs_fn(f)):
+                todo.append(f)
+        except Exception as e:
+            # e.g. an unparseable name or a vanished file: report it, keep the batch going
+            records.append(_report(dict(file=str(f), ok=False, rows=0, bytes=0, seconds=0.0,
+                                        error=f"{type(e).__name__}: {e}",
+                                        traceback=traceback.format_exc())))
+    skipped = len(files) - len(todo) - len(records)
+    print(f"🚀 [{label}] {len(todo)} files to process, {skipped} up to date, {workers} workers")
+
+    t0 = time.perf_counter()
+    if workers <= 1 or len(todo) <= 1:
+        for f in todo:
+            records.append(_report(_run_one(process_fn, outputs_fn, f)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futs = [ex.submit(_run_one, process_fn, outputs_fn, f) for f in todo]
+            for fut in as_completed(futs):
+                records.append(_report(fut.result()))
+    elapsed = time.perf_counter() - t0
+
+    ok = [r for r in records if r["ok"]]
+    failed = [r for r in records if not r["ok"]]
+    rows = sum(r["rows"] for r in ok)
+    mb = sum(r["bytes"] for r in ok) / (1024 * 1024)
+    rate = lambda x: x / elapsed if elapsed > 0 else float("nan")
+    print(f"\n📊 [{label}] {len(ok)} ok, {len(failed)} failed, {skipped} skipped in {elapsed:.1f} s")
+    print(f"   {rate(len(ok)):.2f} files/s | {rate(rows):,.0f} rows/s | {rate(mb):.1f} MB/s")
+    fetched = sum(r.get("fetched", 0) for r in ok) / (1024 * 1024)
+    if fetched:
+        print(f"   ☁️  fetched {fetched:.1f} MB of {mb:.1f} MB remote objects ({fetched / mb:.1%})")
+    if failed:
+        print("❌ Failed files:")
+        for r in failed:
+            print(f"- {r['file']}: {r['error']}")
+
+    if report:
+        with open(report, "w", encoding="utf-8") as fh:
+            json.dump(dict(label=label, elapsed=elapsed, skipped=skipped, records=records), fh, indent=1)
+    return records
@@ -0,0 +1,182 @@
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pathlib import Path
+from functools import partial
+
+from batch import add_batch_args, run_batch, parse_bbox, write_parquet
+from remote import add_remote_args, remote_inputs, open_h5
+from light import attr_str, midpoint_time  # same OBPG global attributes
+
+CHL_PATH = "geophysical_data/chlor_a"   # mg m^-3
+FLAGS_PATH = "geophysical_data/l2_flags"
+LAT_PATH = "navigation_data/latitude"
+LON_PATH = "navigation_data/longitude"
+SCAN_LINE_PATH = "scan_line_attributes"
+BLOCK_LINES = 512      # scan lines of navigation read per block
+LINE_MARGIN_DEG = 0.5  # slack for swath curvature between start/centre/end pixels
+SCHEMA = pa.schema([
+    ("latitude", pa.float32()), ("longitude", pa.float32()), ("bin_time", pa.timestamp("ms")),
+    ("measure_chlorophyll", pa.float32()),
+])  # written as-is when a swath has no unflagged pixels (in the box)
+
+# OBPG default masks for chlor_a (L3 binning "flaguse" for the OC suite)
+CHL_MASK_FLAGS = [
+    "ATMFAIL", "LAND", "HILT", "HISATZEN", "STRAYLIGHT", "CLDICE", "COCCOLITH",
+    "LOWLW", "CHLWARN", "CHLFAIL", "NAVWARN", "MAXAERITER", "ATMWARN",
+    "HISOLZEN", "NAVFAIL", "FILTER", "HIGLINT",
+]
+
+def flag_mask(flags_ds, names=CHL_MASK_FLAGS):
+    """OR of the bit masks of `names`, from the l2_flags flag_meanings/flag_masks attributes."""
+    meanings = attr_str(flags_ds.attrs, "flag_meanings").split()
+    masks = np.atleast_1d(flags_ds.attrs.get("flag_masks", []))
+    bits = dict(zip(meanings, masks.astype(np.int64) & 0xFFFFFFFF))
+    mask = 0
+    for name in names:
+        mask |= int(bits.get(name, 0))
+    return np.int32(np.uint32(mask).view(np.int32))  # l2_flags is int32, bit 31 included
+
+def scaled(ds, sl):
+    """Read ds[sl] as float32, applying _FillValue, scale_factor and add_offset."""
+    raw = ds[sl]
+    values = raw.astype(np.float32)
+    fill = ds.attrs.get("_FillValue")
+    if fill is not None:
+        values[raw == np.asarray(fill).item()] = np.nan
+    values *= np.float32(ds.attrs.get("scale_factor", 1.0))
+    values += np.float32(ds.attrs.get("add_offset", 0.0))
+    return values
+
+def candidate_lines(f, bbox, margin=LINE_MARGIN_DEG):
+    """
+    [start, stop) scan lines that may intersect `bbox`.
+
+    Uses the per-line start/centre/end coordinates of scan_line_attributes
+    (a few KB) so the full navigation arrays are only read around the AOI;
+    the whole swath if they are missing or the swath crosses the antimeridian.
+    """
+    n_lines = f[LAT_PATH].shape[0]
+    g = f.get(SCAN_LINE_PATH)
+    keys = ("slat", "clat", "elat", "slon", "clon", "elon")
+    if bbox is None or g is None or not all(k in g for k in keys):
+        return 0, n_lines
+    lat = np.stack([g[k][:] for k in keys[:3]]).astype(np.float64)
+    lon = np.stack([g[k][:] for k in keys[3:]]).astype(np.float64)
+    lat[np.abs(lat) > 90] = np.nan    # fill values
+    lon[np.abs(lon) > 180] = np.nan
+    if np.nanmax(lon) - np.nanmin(lon) > 180:
+        return 0, n_lines
+    min_lon, min_lat, max_lon, max_lat = bbox
+    with np.errstate(invalid="ignore"):
+        hit = ((np.nanmax(lat, axis=0) >= min_lat - margin) & (np.nanmin(lat, axis=0) <= max_lat + margin)
+               & (np.nanmax(lon, axis=0) >= min_lon - margin) & (np.nanmin(lon, axis=0) <= max_lon + margin))
+    lines = np.nonzero(hit)[0]
+    if lines.size == 0:
+        return 0, 0
+    return int(lines[0]), int(lines[-1]) + 1
+
+def aoi_windows(lat_ds, lon_ds, bbox, block_lines=BLOCK_LINES, line_range=None):
+    """
+    Yield (lines, pixels, inside, lat, lon) windows of the swath inside `bbox`.
+
+    Navigation is scanned `block_lines` at a time (only within `line_range`
+    if given); blocks without any pixel in the box yield nothing, and each
+    hit is narrowed to the lines and pixel columns that actually contain
+    AOI pixels.
+    """
+    start, stop = line_range or (0, lat_ds.shape[0])
+    for l0 in range(start, stop, block_lines):
+        sl = slice(l0, min(l0 + block_lines, stop))
+        lat, lon = lat_ds[sl], lon_ds[sl]
+        if bbox is None:
+            inside = np.isfinite(lat) & np.isfinite(lon)
+        else:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        lines = np.nonzero(inside.any(axis=1))[0]
+        if lines.size == 0:
+            continue
+        pixels = np.nonzero(inside.any(axis=0))[0]
+        rows = slice(lines[0], lines[-1] + 1)
+        cols = slice(pixels[0], pixels[-1] + 1)
+        yield (slice(l0 + rows.start, l0 + rows.stop), cols,
+               inside[rows, cols], lat[rows, cols], lon[rows, cols])
+
+def iter_swath_chunks(filename, bbox=None, mask_flags=CHL_MASK_FLAGS, block_lines=BLOCK_LINES):
+    """
+    Yield DataFrames of valid chlor_a pixels of one L2 OC swath, one per AOI window.
+
+    Navigation is only scanned over the scan lines that scan_line_attributes
+    place near `bbox`, and chlor_a and l2_flags are only read for the
+    line/pixel window of each navigation block that intersects it; flagged
+    pixels (any bit of `mask_flags` set) and fill values are dropped.
+    """
+    with open_h5(filename) as f:
+        bin_time = midpoint_time(f.attrs)
+        chl_ds, flags_ds = f[CHL_PATH], f[FLAGS_PATH]
+        bad_bits = flag_mask(flags_ds, mask_flags)
+
+        line_range = candidate_lines(f, bbox)
+        for lines, cols, inside, lat, lon in aoi_windows(f[LAT_PATH], f[LON_PATH], bbox, block_lines, line_range):
+            chl = scaled(chl_ds, (lines, cols))
+            keep = inside & ((flags_ds[lines, cols] & bad_bits) == 0) & np.isfinite(chl)
+            if not keep.any():
+                continue
+            n = int(keep.sum())
+            yield pd.DataFrame({
+                "latitude": lat[keep].astype(np.float32),
+                "longitude": lon[keep].astype(np.float32),
+                "bin_time": pd.Series(bin_time, index=range(n), dtype="datetime64[ms]"),
+                "measure_chlorophyll": chl[keep],
+            })
+
+def load_file(filename, bbox=None):
+    """Load the valid chlor_a pixels of one swath into one DataFrame."""
+    chunks = list(iter_swath_chunks(filename, bbox=bbox))
+    if not chunks:
+        return pd.DataFrame(columns=["latitude", "longitude", "bin_time", "measure_chlorophyll"])
+    return pd.concat(chunks, ignore_index=True)
+
+def output_paths(file, output_dir):
+    # AQUA_MODIS.20171231T185501.L2.OC.nc → year=2017/month=12/
+    day = pd.Timestamp(Path(file).name.split(".")[1][:8])
+    return [Path(output_dir) / f"year={day.year}" / f"month={day.month}" / f"{Path(file).stem}.parquet"]
+
+def transform_file(file, output_dir, bbox=None):
+    """Transform one L2 swath to Parquet; returns the number of rows written."""
+    output_parquet, = output_paths(file, output_dir)
+    output_parquet.parent.mkdir(parents=True, exist_ok=True)
+    return write_parquet(iter_swath_chunks(file, bbox=bbox), output_parquet, SCHEMA)
+
+def main():
+    p = argparse.ArgumentParser(description="Transform MODIS L2 OC swaths (chlor_a) to Parquet.")
+    p.add_argument("--bbox", help="min_lon,min_lat,max_lon,max_lat or 'seaflower'")
+    add_batch_args(p)
+    add_remote_args(p)
+    args = p.parse_args()
+    bbox = parse_bbox(args.bbox)
+
+    project_root = Path(__file__).resolve().parent.parent
+    data_dir = project_root / "downloads/clorophyll"
+    output_dir = project_root / "data/chlorophyll"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.s3 is not None:
+        all_files = remote_inputs(args.s3 or data_dir / "s3.txt", "*.L2.OC.nc", args.s3_anon, args.s3_endpoint)
+    else:
+        all_files = sorted(data_dir.rglob("*.L2.OC.nc"))
+    if not all_files:
+        print("⚠️ No L2 OC .nc files found in the 'downloads/clorophyll' directory.")
+        return
+
+    run_batch(
+        all_files,
+        partial(transform_file, output_dir=output_dir, bbox=bbox),
+        partial(output_paths, output_dir=output_dir),
+        workers=args.workers, force=args.force, report=args.report, label="chlorophyll",
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,125 @@
-import h5py
-import datetime
+import argparse
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from pathlib import Path
+from functools import partial
+
+from batch import add_batch_args, run_batch, parse_bbox, write_parquet
+from remote import add_remote_args, remote_inputs, open_h5
+
+GPS_BASE_TIME = np.datetime64("1980-01-06T00:00:00", "us")
+LEAP_SECONDS = 18  # GPS - UTC offset for the whole ICESat-2 mission (since 2017)
+
+BEAMS = ["gt1l", "gt1r", "gt2l", "gt2r", "gt3l", "gt3r"]
+PHOTON_FIELDS = ["lat_ph", "lon_ph", "surface_h", "delta_time"]
+CHUNK_ROWS = 1_000_000  # approximate rows read per slice
+SCHEMA = pa.schema([
+    ("latitude", pa.float64()), ("longitude", pa.float64()), ("utc_time", pa.timestamp("us")),
+    ("surface_height", pa.float32()), ("beam", pa.dictionary(pa.int8(), pa.string())),
+])  # written as-is when a granule has no photons (in the box)
 
 def return_date(gps_epoch, delta_time):
-    """Convert GPS epoch + delta_time into UTC datetime objects."""
-    leap_seconds = 18
-    gps_start_times = gps_epoch + delta_time
-    base_time = datetime.datetime(1980, 1, 6)
-    return [
-        base_time + datetime.timedelta(seconds=float(t) - leap_seconds)
-        for t in gps_start_times
-    ]
-
-def load_file(filename):
-    # Open the HDF5 file
-    with h5py.File(filename, "r") as f:
-        beam = "gt1l"  # choose one beam; can be changed
-
-        # Extract required datasets
-        lat = f[beam]["lat_ph"][:]
-        lon = f[beam]["lon_ph"][:]
-        surface_h = f[beam]["surface_h"][:]
-        delta_time = f[beam]["delta_time"][:]
+    """Convert GPS epoch + delta_time (seconds) into a UTC datetime64[us] array."""
+    gps_seconds = gps_epoch + np.asarray(delta_time, dtype=np.float64) - LEAP_SECONDS
+    # Whole seconds and fraction kept apart so the microsecond rounding
+    # matches datetime.timedelta(seconds=...)
+    whole = np.floor(gps_seconds)
+    micros = whole.astype(np.int64) * 1_000_000 + np.rint((gps_seconds - whole) * 1e6).astype(np.int64)
+    return GPS_BASE_TIME + micros.astype("timedelta64[us]")
+
+def beam_slices(n_rows, chunk_rows, target_rows=CHUNK_ROWS):
+    """Row slices aligned to the HDF5 chunk size, about `target_rows` long."""
+    step = max(1, target_rows // chunk_rows) * chunk_rows
+    for start in range(0, n_rows, step):
+        yield slice(start, min(start + step, n_rows))
+
+def iter_beam_chunks(filename, beams=BEAMS, bbox=None, target_rows=CHUNK_ROWS):
+    """
+    Yield per-chunk photon DataFrames for every ground track of a granule.
+
+    Datasets are read in HDF5 chunk-aligned slices so memory stays bounded
+    whatever the granule size. With `bbox` = (min_lon, min_lat, max_lon, max_lat)
+    only lat/lon are read for slices outside the box, and the other
+    datasets are read over the in-box span of a slice and masked.
+    """
+    with open_h5(filename) as f:
         gps_epoch = f["ancillary_data"]["atlas_sdp_gps_epoch"][()]
 
-        # Compute UTC times
-        utc_times = return_date(gps_epoch, delta_time)
+        for beam in beams:
+            if beam not in f or not all(k in f[beam] for k in PHOTON_FIELDS):
+                continue
+            g = f[beam]
+            # Ensure consistent lengths
+            n_rows = min(g[k].shape[0] for k in PHOTON_FIELDS)
+            chunk_rows = g["lat_ph"].chunks[0] if g["lat_ph"].chunks else target_rows
+
+            for sl in beam_slices(n_rows, chunk_rows, target_rows):
+                lat = g["lat_ph"][sl]
+                lon = g["lon_ph"][sl]
+                if bbox is not None:
+                    min_lon, min_lat, max_lon, max_lat = bbox
+                    mask = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+                    hits = np.flatnonzero(mask)
+                    if hits.size == 0:
+                        continue
+                    # Other datasets are only read over the in-box span of the slice
+                    mask = mask[hits[0]:hits[-1] + 1]
+                    sl = slice(sl.start + hits[0], sl.start + hits[-1] + 1)
+                    lat, lon = lat[hits], lon[hits]
+                else:
+                    mask = slice(None)
 
-        # Ensure consistent lengths
-        min_len = min(len(lat), len(lon), len(surface_h), len(utc_times))
-        lat, lon, surface_h, utc_times = lat[:min_len], lon[:min_len], surface_h[:min_len], utc_times[:min_len]
+                yield pd.DataFrame({
+                    "latitude": lat,
+                    "longitude": lon,
+                    "utc_time": return_date(gps_epoch, g["delta_time"][sl][mask]),
+                    "surface_height": g["surface_h"][sl][mask],
+                    "beam": pd.Categorical([beam] * len(lat), categories=BEAMS),
+                })
 
-        # Create DataFrame
-        df = pd.DataFrame({
-            "latitude": lat,
-            "longitude": lon,
-            "utc_time": [t.isoformat() for t in utc_times],
-            "surface_height": surface_h
-        })
+def load_file(filename, beams=BEAMS, bbox=None):
+    """Load all photons of a granule (all beams) into one DataFrame."""
+    chunks = list(iter_beam_chunks(filename, beams, bbox))
+    if not chunks:
+        return pd.DataFrame(columns=["latitude", "longitude", "utc_time", "surface_height", "beam"])
+    return pd.concat(chunks, ignore_index=True)
 
-    return df
+def output_paths(file, output_dir):
+    return [Path(output_dir) / f"{Path(file).stem}.parquet"]
+
+def transform_file(file, output_dir, bbox=None):
+    """Transform one granule to Parquet; returns the number of rows written."""
+    output_parquet, = output_paths(file, output_dir)
+    return write_parquet(iter_beam_chunks(file, bbox=bbox), output_parquet, SCHEMA)
 
 def main():
+    p = argparse.ArgumentParser(description="Transform ICESat-2 ATL24 granules to Parquet.")
+    p.add_argument("--bbox", help="min_lon,min_lat,max_lon,max_lat or 'seaflower'")
+    add_batch_args(p)
+    add_remote_args(p)
+    args = p.parse_args()
+    bbox = parse_bbox(args.bbox)
+
     project_root = Path(__file__).resolve().parent.parent
     data_dir = project_root / "downloads/depth"
     output_dir = project_root / "data/depth"
     output_dir.mkdir(exist_ok=True)
 
-    all_files = sorted(data_dir.glob("*.h5"))
+    if args.s3 is not None:
+        all_files = remote_inputs(args.s3 or data_dir / "s3.txt", "*.h5", args.s3_anon, args.s3_endpoint)
+    else:
+        all_files = sorted(data_dir.glob("*.h5"))
     if not all_files:
         print("⚠️ No .h5 files found in the 'data' directory.")
         return
 
-    for file in all_files:
-        print(f"🔍 Processing {file.name} ...")
-        try:
-            df = load_file(file)
-            output_csv = output_dir / f"{file.stem}.csv"
-            df.to_csv(output_csv, index=False)
-            print(f"✅ Saved: {output_csv} ({len(df)} rows).")
-        except Exception as e:
-            print(f"❌ Error processing {file.name}: {e}")
+    run_batch(
+        all_files,
+        partial(transform_file, output_dir=output_dir, bbox=bbox),
+        partial(output_paths, output_dir=output_dir),
+        workers=args.workers, force=args.force, report=args.report, label="depth",
+    )
 
 if __name__ == "__main__":
     main()
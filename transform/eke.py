@@ -0,0 +1,256 @@
+import re
+import sys
+import gzip
+import shutil
+import zipfile
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import xarray as xr
+from pathlib import Path
+from functools import partial
+
+from batch import add_batch_args, run_batch, parse_bbox, write_parquet, is_up_to_date
+
+U_NAME, V_NAME = "ugosa", "vgosa"  # geostrophic velocity anomalies (m/s)
+LAT_NAME, LON_NAME, TIME_NAME = "latitude", "longitude", "time"
+DAY_RE = re.compile(r"(?<!\d)(\d{8})(?!\d)")
+SCHEMA = pa.schema([
+    ("latitude", pa.float32()), ("longitude", pa.float32()), ("bin_time", pa.timestamp("ms")),
+    ("eke_information", pa.float32()),
+])  # written as-is when a day has no valid cells (in the box)
+REAL_SUFFIX = "__real"  # unpacked NetCDF next to the archive CDS delivered under the same .nc name
+
+@contextlib.contextmanager
+def open_daily(path):
+    """
+    Open one daily sea-level file lazily with xarray.
+
+    CDS sometimes delivers ZIP/GZIP archives under a .nc name; those are
+    unpacked to a temporary directory that lives as long as the dataset.
+    """
+    with open(path, "rb") as fh:
+        head = fh.read(4)
+    with tempfile.TemporaryDirectory() as tmp:
+        if head.startswith(b"PK"):
+            with zipfile.ZipFile(path) as zf:
+                members = [m for m in zf.namelist() if m.lower().endswith(".nc")] or zf.namelist()
+                path = zf.extract(members[0], tmp)
+        elif head.startswith(b"\x1f\x8b"):
+            with gzip.open(path, "rb") as src, open(Path(tmp) / "day.nc", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            path = Path(tmp) / "day.nc"
+        with xr.open_dataset(path) as ds:
+            yield ds
+
+def crop(ds, bbox=None):
+    """
+    Lazy index-based crop to `bbox` (longitudes compared in [-180, 180)).
+
+    min_lon > max_lon means a box across the antimeridian. A box across the
+    grid's own seam (0° on a 0..360 grid, 180° on a -180..180 one) covers
+    two runs of columns; they are taken as one index array ordered west to
+    east rather than one slice spanning the whole globe.
+    """
+    if bbox is None:
+        return ds
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lat = ds[LAT_NAME].values
+    lon = (ds[LON_NAME].values + 180.0) % 360.0 - 180.0
+    ilat = np.nonzero((lat >= min_lat) & (lat <= max_lat))[0]
+    if min_lon <= max_lon:
+        in_lon = (lon >= min_lon) & (lon <= max_lon)
+    else:
+        in_lon = (lon >= min_lon) | (lon <= max_lon)
+    ilon = np.nonzero(in_lon)[0]
+    if ilat.size == 0 or ilon.size == 0:
+        return ds.isel({LAT_NAME: slice(0, 0), LON_NAME: slice(0, 0)})
+    ilon = ilon[np.argsort((lon[ilon] - min_lon) % 360.0, kind="stable")]
+    if np.all(np.diff(ilon) == 1):
+        ilon = slice(ilon[0], ilon[-1] + 1)
+    return ds.isel({LAT_NAME: slice(ilat[0], ilat[-1] + 1), LON_NAME: ilon})
+
+def eke_grids(ds):
+    """Yield (time, EKE = ½(u'² + v'²) grid as float32 in m²/s²) for each time step of `ds`."""
+    if U_NAME not in ds or V_NAME not in ds:
+        raise KeyError(f"{U_NAME}/{V_NAME} not found (need geostrophic velocity anomalies)")
+    u = ds[U_NAME].transpose(TIME_NAME, LAT_NAME, LON_NAME)
+    v = ds[V_NAME].transpose(TIME_NAME, LAT_NAME, LON_NAME)
+    for t in range(u.sizes[TIME_NAME]):
+        # Only this time step (and crop) is read from disk
+        ut = u[t].values.astype(np.float32)
+        vt = v[t].values.astype(np.float32)
+        yield pd.Timestamp(u[TIME_NAME].values[t]), np.float32(0.5) * (ut * ut + vt * vt)
+
+def grid_frame(lat, lon, grid, bin_time):
+    """Finite cells of a (lat, lon) grid as a DataFrame."""
+    ilat, ilon = np.nonzero(np.isfinite(grid))
+    return pd.DataFrame({
+        "latitude": lat[ilat].astype(np.float32),
+        "longitude": ((lon[ilon] + 180.0) % 360.0 - 180.0).astype(np.float32),
+        "bin_time": pd.Series(bin_time, index=range(len(ilat)), dtype="datetime64[ms]"),
+        "eke_information": grid[ilat, ilon],
+    })
+
+def iter_daily_frames(path, bbox=None):
+    """Yield one DataFrame of EKE cells per time step of a daily file."""
+    with open_daily(path) as ds:
+        ds = crop(ds, bbox)
+        lat, lon = ds[LAT_NAME].values, ds[LON_NAME].values
+        for t, grid in eke_grids(ds):
+            yield grid_frame(lat, lon, grid, t)
+
+def composite(paths, bbox=None):
+    """
+    Mean EKE over several daily files, accumulated one day at a time.
+
+    Only the running sum/count grids and the current day are in memory,
+    so the window length does not change the memory footprint. Cells are
+    averaged over the days they are valid. A file that cannot be read is
+    reported and left out. Returns (lat, lon, mean grid, failed paths);
+    the mean is None if no grid was read.
+    """
+    total = count = lat = lon = None
+    failed = []
+    for path in paths:
+        try:
+            with open_daily(path) as ds:
+                ds = crop(ds, bbox)
+                # read the whole file before adding it, so a failure halfway leaves no partial day
+                grids = [grid for _, grid in eke_grids(ds)]
+                if grids and total is None:
+                    lat, lon = ds[LAT_NAME].values, ds[LON_NAME].values
+                    total = np.zeros(grids[0].shape, dtype=np.float64)
+                    count = np.zeros(grids[0].shape, dtype=np.int32)
+        except Exception as e:
+            print(f"❌ {Path(path).name}: {type(e).__name__}: {e}", file=sys.stderr)
+            failed.append(path)
+            continue
+        for grid in grids:
+            valid = np.isfinite(grid)
+            total[valid] += grid[valid]
+            count += valid
+    if total is None:
+        return lat, lon, None, failed
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (total / count).astype(np.float32)
+    return lat, lon, mean, failed
+
+def file_day(path):
+    # satellite-sea-level-global_20140101.nc / ..._20140101__real.nc → 2014-01-01
+    m = DAY_RE.search(Path(path).name)
+    if m is None:
+        raise ValueError(f"no YYYYMMDD date in {Path(path).name}")
+    return pd.Timestamp(m.group(1))
+
+def file_stem(path):
+    """Output name of a daily file: its stem without the __real suffix."""
+    stem = Path(path).stem
+    return stem[:-len(REAL_SUFFIX)] if stem.endswith(REAL_SUFFIX) else stem
+
+def daily_files(paths):
+    """
+    One input per day, sorted by day.
+
+    A day downloaded as an archive (X.nc) and also unpacked (X__real.nc)
+    is read once, from the unpacked file. Files without a valid date in
+    their name are skipped with a warning.
+    """
+    by_day = {}
+    for p in paths:
+        try:
+            day = file_day(p)
+        except ValueError as e:
+            print(f"⚠️ Skipping {Path(p).name}: {e}")
+            continue
+        current = by_day.get(day)
+        if current is None or Path(p).stem.endswith(REAL_SUFFIX):
+            by_day[day] = p
+    return [by_day[d] for d in sorted(by_day)]
+
+def window_start(day, days):
+    """First day of the `days`-day window of the year that contains `day`."""
+    return pd.Timestamp(day.year, 1, 1) + pd.Timedelta(days=(day.dayofyear - 1) // days * days)
+
+def output_paths(file, output_dir):
+    day = file_day(file)
+    return [Path(output_dir) / f"year={day.year}" / f"month={day.month}" / f"{file_stem(file)}.parquet"]
+
+def transform_file(file, output_dir, bbox=None):
+    """Transform one daily file to Parquet; returns the number of rows written."""
+    output_parquet, = output_paths(file, output_dir)
+    output_parquet.parent.mkdir(parents=True, exist_ok=True)
+    return write_parquet(iter_daily_frames(file, bbox), output_parquet, SCHEMA)
+
+def run_composites(files, output_dir, days, bbox=None, force=False):
+    """
+    Write one Parquet of mean EKE per `days`-day window (bin_time = window start).
+
+    Windows restart every 1 January (the last one of a year may be
+    shorter), so adding files never shifts existing windows; a window is
+    skipped if its output is newer than all its inputs. A window with an
+    unreadable day is not written (so the next run retries it) and the
+    failed windows are listed at the end.
+    """
+    windows = {}
+    for f in files:
+        windows.setdefault(window_start(file_day(f), days), []).append(f)
+
+    print(f"🚀 [eke] {len(files)} daily files → {len(windows)} composites of {days} days")
+    failed_windows = []
+    for start, members in sorted(windows.items()):
+        end = min(start + pd.Timedelta(days=days - 1), pd.Timestamp(start.year, 12, 31))
+        out = (Path(output_dir) / f"year={start.year}" / f"month={start.month}"
+               / f"eke_{days}d_{start:%Y%m%d}_{end:%Y%m%d}.parquet")
+        if not force and all(is_up_to_date(f, [out]) for f in members):
+            continue
+        out.parent.mkdir(parents=True, exist_ok=True)
+        lat, lon, mean, failed = composite(members, bbox)
+        if failed or mean is None:
+            failed_windows.append((out.name, failed))
+            continue
+        rows = write_parquet([grid_frame(lat, lon, mean, start)], out)
+        print(f"✅ {out.name}: {len(members)} days, {rows} cells")
+    if failed_windows:
+        print("❌ Failed composites:")
+        for name, failed in failed_windows:
+            days_failed = ", ".join(Path(f).name for f in failed) or "no EKE grid in its files"
+            print(f"- {name}: {days_failed}")
+    return failed_windows
+
+def main():
+    p = argparse.ArgumentParser(description="Compute EKE from daily sea-level anomaly grids.")
+    p.add_argument("--bbox", help="min_lon,min_lat,max_lon,max_lat or 'seaflower'")
+    p.add_argument("--composite", type=int, metavar="DAYS",
+                   help="Write DAYS-day mean composites instead of one table per day")
+    add_batch_args(p)
+    args = p.parse_args()
+    bbox = parse_bbox(args.bbox)
+
+    project_root = Path(__file__).resolve().parent.parent
+    data_dir = project_root / "downloads/eke"
+    output_dir = project_root / "data/eke"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    all_files = daily_files(data_dir.rglob("*.nc"))
+    if not all_files:
+        print("⚠️ No .nc files found in the 'downloads/eke' directory.")
+        return
+
+    if args.composite:
+        run_composites(all_files, output_dir / f"composite_{args.composite}d",
+                       args.composite, bbox, args.force)
+        return
+
+    run_batch(
+        all_files,
+        partial(transform_file, output_dir=output_dir, bbox=bbox),
+        partial(output_paths, output_dir=output_dir),
+        workers=args.workers, force=args.force, report=args.report, label="eke",
+    )
+
+if __name__ == "__main__":
+    main()
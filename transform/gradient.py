@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+|∇T| for rasters, in units per km, on geographic and projected grids.
+
+The raster is processed in row blocks of float32 with a one-row halo on
+each side, so interior pixels get exactly the same central differences as
+a whole-array computation while memory stays at a few blocks. Spacing
+comes from the affine transform:
+
+ - geographic CRS (degrees): dy = R·|Δlat|, dx = R·cos(lat)·Δlon, per row
+ - projected CRS: pixel size × the CRS linear unit (metres) → km
+
+Stencils: "central" (np.gradient: central differences inside, one-sided
+at the raster border), or the 3×3 "sobel" / "scharr" operators that
+smooth across the derivative and are better suited for front detection
+(the raster border is edge-replicated). NaNs propagate to every pixel
+whose stencil touches them.
+
+Benchmark against the old whole-tile float64 np.gradient with:
+    python transform/gradient.py --size 8000
+"""
+
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088  # mean Earth radius (IUGG)
+BLOCK_ROWS = 512             # rows per block (plus halo)
+
+# 3×3 derivative stencils: (corner weight, centre weight)
+STENCILS = {
+    "sobel": (1.0, 2.0),
+    "scharr": (3.0, 10.0),
+}
+METHODS = ["central"] + list(STENCILS)
+
+
+def pixel_spacing_km(transform, crs, rows):
+    """
+    (dy_km, dx_km) for the given row indices of a north-up raster.
+
+    dy_km is a scalar; dx_km is per row on geographic grids (it shrinks
+    with cos(latitude)) and a scalar on projected grids.
+    """
+    if crs is not None and crs.is_geographic:
+        deg = np.pi / 180.0
+        lat = transform.f + transform.e * (rows + 0.5)
+        dy = EARTH_RADIUS_KM * abs(transform.e) * deg
+        dx = EARTH_RADIUS_KM * abs(transform.a) * deg * np.cos(lat * deg)
+        return np.float32(dy), dx.astype(np.float32)
+
+    to_km = 1e-3
+    if crs is not None:
+        try:
+            to_km = crs.linear_units_factor[1] / 1000.0
+        except Exception:
+            pass  # no linear unit declared: assume metres
+    return np.float32(abs(transform.e) * to_km), np.float32(abs(transform.a) * to_km)
+
+
+def _central(block, top, bottom):
+    """d/drow, d/dcol in pixel units; rows 0 and -1 are halos unless at the raster edge."""
+    d_row = np.gradient(block, axis=0)
+    d_col = np.gradient(block, axis=1)
+    sl = slice(0 if top else 1, None if bottom else -1)
+    return d_row[sl], d_col[sl]
+
+
+def _stencil(block, top, bottom, weights):
+    """Sobel/Scharr d/drow, d/dcol in pixel units on the inner rows of `block`."""
+    w_corner, w_centre = weights
+    norm = np.float32(2.0 * (2.0 * w_corner + w_centre))
+    # Replicate the raster border only (halo rows already come from the raster)
+    p = np.pad(block, ((1 if top else 0, 1 if bottom else 0), (1, 1)), mode="edge")
+    up, mid, down = p[:-2], p[1:-1], p[2:]
+
+    d_col = (w_corner * (up[:, 2:] - up[:, :-2])
+             + w_centre * (mid[:, 2:] - mid[:, :-2])
+             + w_corner * (down[:, 2:] - down[:, :-2])) / norm
+    d_row = (w_corner * (down[:, :-2] - up[:, :-2])
+             + w_centre * (down[:, 1:-1] - up[:, 1:-1])
+             + w_corner * (down[:, 2:] - up[:, 2:])) / norm
+    return d_row, d_col
+
+
+def gradient_magnitude(values, transform, crs, method="central", block_rows=BLOCK_ROWS, out=None):
+    """
+    |∇values| per km as float32, computed block by block.
+
+    `values` may be any 2-D array (including a float64 one or a memmap);
+    only `block_rows` + 2 rows are ever converted to float32 at once.
+    """
+    if method != "central" and method not in STENCILS:
+        raise ValueError(f"Unknown gradient method {method!r}; choose from {METHODS}")
+
+    n_rows = values.shape[0]
+    if out is None:
+        out = np.empty(values.shape, dtype=np.float32)
+
+    for r0 in range(0, n_rows, block_rows):
+        r1 = min(r0 + block_rows, n_rows)
+        top, bottom = r0 == 0, r1 == n_rows
+        block = np.asarray(values[max(r0 - 1, 0):min(r1 + 1, n_rows)], dtype=np.float32)
+
+        if block.shape[0] < 2 or block.shape[1] < 2:
+            out[r0:r1] = np.nan  # np.gradient needs two samples per axis
+            continue
+        if method == "central":
+            d_row, d_col = _central(block, top, bottom)
+        else:
+            d_row, d_col = _stencil(block, top, bottom, STENCILS[method])
+
+        dy, dx = pixel_spacing_km(transform, crs, np.arange(r0, r1))
+        d_row /= dy
+        d_col /= np.reshape(dx, (-1, 1)) if np.ndim(dx) else dx
+        np.hypot(d_row, d_col, out=out[r0:r1])
+    return out
+
+
+def benchmark(size, block_rows=BLOCK_ROWS, method="central"):
+    """Old whole-tile float64 np.gradient vs. the blocked float32 engine on a synthetic tile."""
+    from affine import Affine
+    from rasterio.crs import CRS
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    sst = (300.0 + 5.0 * np.sin(x / 400.0) * np.cos(y / 300.0)
+           + rng.normal(0.0, 0.05, (size, size))).astype(np.float32)
+    sst[rng.random((size, size)) < 0.01] = np.nan
+    transform = Affine(90.0, 0.0, 500000.0, 0.0, -90.0, 1600000.0)  # 90 m UTM tile
+    crs = CRS.from_epsg(32617)
+
+    def run(fn):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        return result, elapsed, peak
+
+    def old():
+        s = sst.astype(float)
+        dT_dy, dT_dx = np.gradient(s, -transform.e, transform.a)
+        return np.sqrt(dT_dx**2 + dT_dy**2) * 1000.0  # per m → per km
+
+    ref, t_old, m_old = run(old)
+    new, t_new, m_new = run(lambda: gradient_magnitude(sst, transform, crs, method, block_rows))
+
+    print(f"📐 {size}×{size} tile ({sst.nbytes / 2**20:.0f} MB float32), method={method}, block_rows={block_rows}")
+    print(f"   float64 np.gradient : {t_old:6.2f} s, peak {m_old:8.1f} MB")
+    print(f"   blocked float32     : {t_new:6.2f} s, peak {m_new:8.1f} MB (incl. {new.nbytes / 2**20:.0f} MB output)")
+    if method == "central":
+        both = np.isfinite(ref) & np.isfinite(new)
+        same_nan = np.array_equal(np.isnan(ref), np.isnan(new))
+        err = np.max(np.abs(ref[both] - new[both]) / np.maximum(ref[both], 1e-6))
+        print(f"   max relative difference {err:.1e}, same NaN mask: {same_nan}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the blocked SST gradient engine.")
+    p.add_argument("--size", type=int, default=8000, help="Synthetic tile size in pixels (square)")
+    p.add_argument("--block-rows", type=int, default=BLOCK_ROWS)
+    p.add_argument("--method", choices=METHODS, default="central")
+    args = p.parse_args()
+    benchmark(args.size, args.block_rows, args.method)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pathlib import Path
+from functools import partial
+
+from batch import add_batch_args, run_batch, parse_bbox, write_parquet
+from remote import add_remote_args, remote_inputs, open_h5
+
+L3B_GROUP = "level-3_binned_data"
+PRODUCT = "par"          # einstein m^-2 day^-1
+CHUNK_ROWS = 1_000_000   # approximate BinList rows read per slice
+SCHEMA = pa.schema([
+    ("latitude", pa.float32()), ("longitude", pa.float32()), ("bin_time", pa.timestamp("ms")),
+    ("normalized_light", pa.float32()),
+])  # written as-is when a file has no valid bins (in the box)
+
+def attr_str(attrs, key):
+    v = attrs.get(key, b"")
+    return v.decode() if isinstance(v, (bytes, np.bytes_)) else str(v)
+
+def midpoint_time(attrs):
+    """Midpoint of time_coverage_start/end as a naive UTC Timestamp (NaT if missing)."""
+    t0 = pd.to_datetime(attr_str(attrs, "time_coverage_start") or None, utc=True)
+    t1 = pd.to_datetime(attr_str(attrs, "time_coverage_end") or None, utc=True)
+    if pd.isna(t0):
+        return pd.NaT
+    mid = t0 if pd.isna(t1) else t0 + (t1 - t0) / 2
+    return mid.tz_localize(None)
+
+def isin_rows(bin_index):
+    """
+    Per-row ISIN grid from the L3b BinIndex.
+
+    Rows run south to north; `start_num` is the first bin number of a
+    row, `max` its number of bins and `extent` how many of them are
+    stored, so BinList offsets are the cumulative extents.
+    """
+    n_rows = len(bin_index)
+    row_lat = -90.0 + 180.0 * (np.arange(n_rows) + 0.5) / n_rows
+    start_num = bin_index["start_num"].astype(np.int64)
+    n_bins = bin_index["max"].astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(bin_index["extent"], dtype=np.int64)])
+    return row_lat, start_num, n_bins, offsets
+
+def decode_bins(bin_num, row_lat, start_num, n_bins):
+    """Bin numbers → bin-centre (lat, lon), vectorized over the whole array."""
+    bin_num = bin_num.astype(np.int64)
+    row = np.searchsorted(start_num, bin_num, side="right") - 1
+    col = bin_num - start_num[row]
+    lon = -180.0 + 360.0 * (col + 0.5) / n_bins[row]
+    return row_lat[row], lon
+
+def binlist_range(row_lat, offsets, bbox=None):
+    """BinList [start, stop) covering the ISIN rows whose centre latitude is inside `bbox`."""
+    if bbox is None:
+        return 0, int(offsets[-1])
+    _, min_lat, _, max_lat = bbox
+    rows = np.nonzero((row_lat >= min_lat) & (row_lat <= max_lat))[0]
+    if rows.size == 0:
+        return 0, 0
+    return int(offsets[rows[0]]), int(offsets[rows[-1] + 1])
+
+def iter_bin_chunks(filename, product=PRODUCT, bbox=None, target_rows=CHUNK_ROWS):
+    """
+    Yield DataFrames of bin-centre lat/lon, time and the weighted bin mean.
+
+    Only the BinIndex (one record per ISIN row) is read in full. With
+    `bbox` = (min_lon, min_lat, max_lon, max_lat) it selects the latitude
+    band, and only that BinList/product range is read, in chunk-aligned
+    slices; the longitude test is applied after decoding.
+    """
+    with open_h5(filename) as f:
+        bin_time = midpoint_time(f.attrs)
+        g = f[L3B_GROUP]
+        row_lat, start_num, n_bins, offsets = isin_rows(g["BinIndex"][:])
+        start, stop = binlist_range(row_lat, offsets, bbox)
+
+        binlist, values = g["BinList"], g[product]
+        chunk = binlist.chunks[0] if binlist.chunks else target_rows
+        step = max(1, target_rows // chunk) * chunk
+        for s0 in range(start - start % chunk, stop, step):
+            sl = slice(max(s0, start), min(s0 + step, stop))
+            bins = binlist[sl]
+            lat, lon = decode_bins(bins["bin_num"], row_lat, start_num, n_bins)
+
+            # Weighted bin mean: sum / weights
+            weights = bins["weights"].astype(np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = values[sl]["sum"] / np.where(weights > 0, weights, np.nan)
+            mask = np.isfinite(mean)
+            if bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                mask &= (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+            if not mask.any():
+                continue
+
+            n = int(mask.sum())
+            yield pd.DataFrame({
+                "latitude": lat[mask].astype(np.float32),
+                "longitude": lon[mask].astype(np.float32),
+                "bin_time": pd.Series(bin_time, index=range(n), dtype="datetime64[ms]"),
+                "normalized_light": mean[mask].astype(np.float32),
+            })
+
+def load_file(filename, bbox=None):
+    """Load the decoded bins of one L3b file into one DataFrame."""
+    chunks = list(iter_bin_chunks(filename, bbox=bbox))
+    if not chunks:
+        return pd.DataFrame(columns=["latitude", "longitude", "bin_time", "normalized_light"])
+    return pd.concat(chunks, ignore_index=True)
+
+def output_paths(file, output_dir):
+    # AQUA_MODIS.20140910.L3b.DAY.PAR.x.nc → year=2014/month=9/
+    day = pd.Timestamp(Path(file).name.split(".")[1][:8])
+    return [Path(output_dir) / f"year={day.year}" / f"month={day.month}" / f"{Path(file).stem}.parquet"]
+
+def transform_file(file, output_dir, bbox=None):
+    """Transform one L3b file to Parquet; returns the number of rows written."""
+    output_parquet, = output_paths(file, output_dir)
+    output_parquet.parent.mkdir(parents=True, exist_ok=True)
+    return write_parquet(iter_bin_chunks(file, bbox=bbox), output_parquet, SCHEMA)
+
+def main():
+    p = argparse.ArgumentParser(description="Transform MODIS L3b PAR (light) files to Parquet.")
+    p.add_argument("--bbox", help="min_lon,min_lat,max_lon,max_lat or 'seaflower'")
+    add_batch_args(p)
+    add_remote_args(p)
+    args = p.parse_args()
+    bbox = parse_bbox(args.bbox)
+
+    project_root = Path(__file__).resolve().parent.parent
+    data_dir = project_root / "downloads/light"
+    output_dir = project_root / "data/light"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.s3 is not None:
+        all_files = remote_inputs(args.s3 or data_dir / "s3.txt", "*.L3b.*.nc", args.s3_anon, args.s3_endpoint)
+    else:
+        all_files = sorted(data_dir.rglob("*.L3b.*.nc"))
+    if not all_files:
+        print("⚠️ No L3b .nc files found in the 'downloads/light' directory.")
+        return
+
+    run_batch(
+        all_files,
+        partial(transform_file, output_dir=output_dir, bbox=bbox),
+        partial(output_paths, output_dir=output_dir),
+        workers=args.workers, force=args.force, report=args.report, label="light",
+    )
+
+if __name__ == "__main__":
+    main()
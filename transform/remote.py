@@ -0,0 +1,87 @@
+import os
+import json
+import fnmatch
+import contextlib
+import h5py
+
+REMOTE_PREFIXES = ("s3://", "gs://", "az://", "abfs://", "http://", "https://")
+BLOCK_SIZE = 2 * 1024 * 1024  # bytes per ranged GET
+MAX_BLOCKS = 64               # blocks cached per open file (LRU)
+
+_fetched = 0  # bytes requested from object storage by this process
+
+def is_remote(path):
+    return str(path).startswith(REMOTE_PREFIXES)
+
+def add_remote_args(p):
+    """CLI flags to read granules in place from object storage instead of downloads/."""
+    p.add_argument("--s3", nargs="?", const="", metavar="LIST",
+                   help="Read the granules listed in LIST (default: downloads/<var>/s3.txt) "
+                        "directly from S3 with ranged reads instead of local files")
+    p.add_argument("--s3-anon", action="store_true", help="Unsigned S3 requests (public buckets)")
+    p.add_argument("--s3-endpoint", help="S3 endpoint URL (e.g. a local moto server)")
+    return p
+
+def configure(anon=False, endpoint_url=None):
+    """
+    S3 options for this process and the batch workers.
+
+    They go through fsspec's FSSPEC_S3 environment variable, so spawned
+    worker processes pick them up as well. Credentials come from the usual
+    AWS_* variables (e.g. Earthdata temporary S3 credentials).
+    """
+    import fsspec.config
+    opts = json.loads(os.environ.get("FSSPEC_S3", "{}"))
+    if anon:
+        opts["anon"] = True
+    if endpoint_url:
+        opts["endpoint_url"] = endpoint_url
+    os.environ["FSSPEC_S3"] = json.dumps(opts)
+    fsspec.config.set_conf_env(fsspec.config.conf)
+
+def remote_inputs(list_file, pattern, anon=False, endpoint_url=None):
+    """URLs in `list_file` whose file name matches the glob `pattern`, with S3 options applied."""
+    configure(anon, endpoint_url)
+    with open(list_file, "r", encoding="utf-8") as fh:
+        urls = [ln.strip() for ln in fh if ln.strip() and not ln.startswith("#")]
+    return sorted(u for u in urls if fnmatch.fnmatch(u.rsplit("/", 1)[-1], pattern))
+
+def source_stat(path):
+    """(size in bytes, mtime) of a local file or a remote object."""
+    if not is_remote(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+    from fsspec.core import url_to_fs
+    fs, p = url_to_fs(str(path))
+    info = fs.info(p)
+    modified = info.get("LastModified") or fs.modified(p)
+    return int(info["size"]), modified.timestamp()
+
+@contextlib.contextmanager
+def open_h5(path, block_size=BLOCK_SIZE):
+    """
+    h5py.File on a local path or a remote URL.
+
+    Remote files are opened through fsspec with a block cache, so only the
+    blocks h5py actually touches (superblock, B-trees and the chunks of the
+    selected datasets/slices) are fetched with ranged GETs; the rest of
+    the object is never transferred.
+    """
+    global _fetched
+    if not is_remote(path):
+        with h5py.File(path, "r") as f:
+            yield f
+        return
+    from fsspec.core import url_to_fs
+    fs, p = url_to_fs(str(path))
+    with fs.open(p, "rb", block_size=block_size, cache_type="blockcache",
+                 cache_options={"maxblocks": MAX_BLOCKS}) as fobj:
+        try:
+            with h5py.File(fobj, "r") as f:
+                yield f
+        finally:
+            _fetched += fobj.cache.total_requested_bytes
+
+def fetched_bytes():
+    """Bytes requested from object storage so far by this process."""
+    return _fetched
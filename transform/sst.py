@@ -1,31 +1,44 @@
+import argparse
 import rasterio
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pyproj
 from datetime import datetime
 from pathlib import Path
+from functools import partial
 
-def load_file(filename):
-    """Load SST data from a single ASTER .tif file and compute its gradient."""
+from batch import add_batch_args, run_batch
+from gradient import gradient_magnitude, METHODS
+
+ROW_GROUP_SIZE = 256_000  # rows per Parquet row group (granularity of lat/lon skipping)
+
+def pixel_centers(transform, rows, cols):
+    """Pixel-center (x, y) for row/col index arrays, straight from the affine transform."""
+    c = cols + 0.5
+    r = rows + 0.5
+    xs = transform.a * c + transform.b * r + transform.c
+    ys = transform.d * c + transform.e * r + transform.f
+    return xs, ys
+
+def load_file(filename, method="central"):
+    """Load SST from a single ASTER .tif file and compute its gradient (one DataFrame)."""
     with rasterio.open(filename) as src:
-        sst = src.read(1).astype(float)
+        sst = src.read(1).astype(np.float32)
         transform = src.transform
         crs = src.crs
 
-    # Mask invalid or missing values
-    sst = np.where((sst <= 0) | np.isnan(sst), np.nan, sst)
+    # Mask invalid or missing values (in place, no extra full-size copy)
+    sst[~(sst > 0)] = np.nan
 
-    # Compute spatial gradient (Kelvin/m)
-    dx = transform.a   # pixel width
-    dy = -transform.e  # pixel height (negative in geotransform)
-    dT_dy, dT_dx = np.gradient(sst, dy, dx)
-    sst_gradient = np.sqrt(dT_dx**2 + dT_dy**2)
+    # Spatial gradient in °C/km (K and °C differences are the same), float32 blocks
+    sst_gradient = gradient_magnitude(sst, transform, crs, method)
 
-    # Build coordinate grids
-    height, width = sst.shape
-    rows, cols = np.meshgrid(np.arange(height), np.arange(width), indexing="ij")
-    xs, ys = rasterio.transform.xy(transform, rows, cols)
-    xs, ys = np.array(xs), np.array(ys)
+    # Valid pixels only: coordinates and reprojection are never computed for NaNs
+    mask = ~np.isnan(sst) & ~np.isnan(sst_gradient)
+    rows, cols = np.nonzero(mask)
+    xs, ys = pixel_centers(transform, rows, cols)
 
     # Convert to lat/lon if projected
     if crs and crs.is_projected:
@@ -37,63 +50,70 @@ def load_file(filename):
     # Extract timestamp from filename (e.g. AST_08_00411202019145501_20250906013202_SKT_QA_DataPlane.tif)
     try:
         date_str = filename.stem.split("_")[3]  # '20250906013202'
-        bin_time = datetime.strptime(date_str, "%Y%m%d%H%M%S").isoformat()
+        bin_time = pd.Timestamp(datetime.strptime(date_str, "%Y%m%d%H%M%S"))
     except Exception:
-        bin_time = None
-
-    # Flatten and mask valid pixels
-    mask = ~np.isnan(sst) & ~np.isnan(sst_gradient)
-    lat_flat = lat.flatten()[mask.flatten()]
-    lon_flat = lon.flatten()[mask.flatten()]
-    sst_flat = sst.flatten()[mask.flatten()]
-    grad_flat = sst_gradient.flatten()[mask.flatten()]
-
-    # Build two DataFrames
-    df_sst = pd.DataFrame({
-        "latitude": lat_flat,
-        "longitude": lon_flat,
-        "bin_time": bin_time,
-        "sst": sst_flat
+        bin_time = pd.NaT
+
+    # One table per tile: SST and its gradient share the coordinates
+    return pd.DataFrame({
+        "latitude": np.asarray(lat, dtype=np.float32),
+        "longitude": np.asarray(lon, dtype=np.float32),
+        "bin_time": pd.Series(bin_time, index=range(len(rows)), dtype="datetime64[ms]"),
+        "sst": sst[mask],
+        "sst_gradient": sst_gradient[mask],
     })
 
-    df_dsst = pd.DataFrame({
-        "latitude": lat_flat,
-        "longitude": lon_flat,
-        "bin_time": bin_time,
-        "sst_gradient": grad_flat
-    })
-
-    return df_sst, df_dsst
 
+def write_parquet(df, output_path):
+    """
+    Write a tile as Parquet: float32 columns, dictionary-encoded bin_time and
+    per-row-group min/max statistics. Pixels come in raster row order, so
+    each row group covers a narrow latitude band and readers can skip row
+    groups with lat/lon predicates.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(
+        table, output_path,
+        row_group_size=ROW_GROUP_SIZE,
+        use_dictionary=["bin_time"],
+        write_statistics=True,
+        compression="zstd",
+    )
+
+
+def output_paths(file, outdir):
+    return [Path(outdir) / f"{Path(file).stem}.parquet"]
+
+def transform_file(file, outdir, method="central"):
+    """Transform one tile to a combined SST + dSST Parquet; returns the number of rows written."""
+    df = load_file(Path(file), method)
+    output_parquet, = output_paths(file, outdir)
+    write_parquet(df, output_parquet)
+    return len(df)
 
 def main():
+    p = argparse.ArgumentParser(description="Transform ASTER SST tiles (SST + dSST).")
+    p.add_argument("--gradient", choices=METHODS, default="central",
+                   help="dSST stencil: central differences, or sobel/scharr for front detection")
+    add_batch_args(p)
+    args = p.parse_args()
+
     project_root = Path(__file__).resolve().parent.parent
     data_dir = project_root / "downloads/sst"
-    sst_outdir = project_root / "data/sst"
-    dsst_outdir = project_root / "data/dsst"
-    sst_outdir.mkdir(parents=True, exist_ok=True)
-    dsst_outdir.mkdir(parents=True, exist_ok=True)
+    outdir = project_root / "data/sst"
+    outdir.mkdir(parents=True, exist_ok=True)
 
     all_files = sorted(data_dir.glob("*.tif"))
     if not all_files:
         print("⚠️ No .tif files found in the 'downloads/sst' directory.")
         return
 
-    for file in all_files:
-        print(f"🔍 Processing {file.name} ...")
-        try:
-            df_sst, df_dsst = load_file(file)
-
-            sst_csv = sst_outdir / f"{file.stem}_sst.csv"
-            dsst_csv = dsst_outdir / f"{file.stem}_dsst.csv"
-
-            df_sst.to_csv(sst_csv, index=False)
-            df_dsst.to_csv(dsst_csv, index=False)
-
-            print(f"✅ Saved: {sst_csv} ({len(df_sst)} rows)")
-            print(f"✅ Saved: {dsst_csv} ({len(df_dsst)} rows)")
-        except Exception as e:
-            print(f"❌ Error processing {file.name}: {e}")
+    run_batch(
+        all_files,
+        partial(transform_file, outdir=outdir, method=args.gradient),
+        partial(output_paths, outdir=outdir),
+        workers=args.workers, force=args.force, report=args.report, label="sst",
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Mergeable partial aggregates for (s2_cell_id, time_bin) binning.
+
+A partial keeps, per key and value column:
+ - '<value>_sum', '<value>_count'  → exact mean
+ - '<value>_min', '<value>_max'
+ - '<value>_m2' (optional)         → variance (sum of squared deviations)
+
+Partials from files, workers or earlier runs merge associatively with
+merge_partials(), so a cell observed in several granules ends up as one
+row no matter how the inputs were split. finalize_partials() turns them
+into the unified-table columns.
+"""
+
+import numpy as np
+import pandas as pd
+
+KEYS = ["s2_cell_id", "time_bin"]
+
+# How each partial column merges, by suffix
+MERGE_RULES = {
+    "_sum": "sum",
+    "_count": "sum",
+    "_min": "min",
+    "_max": "max",
+}
+
+
+def partial_aggregate(df, value_name, variance=False, keys=KEYS):
+    """Reduce raw rows to sum/count/min/max (and optionally m2) per key."""
+    if value_name in df.columns:
+        # float64 regardless of the source dtype: float32 sums/m2 would drift as partials merge
+        values = pd.to_numeric(df[value_name], errors="coerce").astype(np.float64)
+    else:
+        values = pd.Series(np.nan, index=df.index)
+    g = values.groupby([df[k] for k in keys])
+
+    out = pd.DataFrame({
+        f"{value_name}_sum": g.sum(),
+        f"{value_name}_count": g.count(),
+        f"{value_name}_min": g.min(),
+        f"{value_name}_max": g.max(),
+    })
+    if variance:
+        # groupby var uses Welford's algorithm; m2 = var(ddof=0) * n
+        out[f"{value_name}_m2"] = g.var(ddof=0).fillna(0.0) * out[f"{value_name}_count"]
+    return out.reset_index()
+
+
+def partial_count(df, count_name, keys=KEYS):
+    """Reduce raw rows to a plain row count per key (e.g. shark_count)."""
+    return df.groupby(keys).size().reset_index(name=count_name)
+
+
+def _merge_rule(col):
+    for suffix, how in MERGE_RULES.items():
+        if col.endswith(suffix):
+            return how
+    return None
+
+
+def merge_partials(partials, keys=KEYS):
+    """
+    Merge partial aggregates into one row per key.
+
+    sum/count add up, min/max take extremes and m2 is combined with Chan's
+    parallel formula M2 = Σ M2_i + Σ n_i (mean_i - mean)², so the result
+    does not depend on how rows were split across partials.
+    """
+    partials = [p for p in partials if p is not None and not p.empty]
+    if not partials:
+        return pd.DataFrame()
+    df = pd.concat(partials, ignore_index=True)
+    if not df.duplicated(keys).any():
+        return df.sort_values(keys, ignore_index=True)
+
+    by = [df[k] for k in keys]
+    spec = dict((c, _merge_rule(c)) for c in df.columns if _merge_rule(c))
+    out = df.groupby(by).agg(spec)
+
+    for m2_col in [c for c in df.columns if c.endswith("_m2")]:
+        value = m2_col[:-len("_m2")]
+        n_i = df[f"{value}_count"]
+        mean_i = df[f"{value}_sum"].where(n_i > 0) / n_i
+        mean = df.groupby(by)[f"{value}_sum"].transform("sum") / df.groupby(by)[f"{value}_count"].transform("sum")
+        dev = (n_i * (mean_i - mean) ** 2).where(n_i > 0, 0.0)
+        out[m2_col] = (df[m2_col].fillna(0.0) + dev).groupby(by).sum()
+
+    return out.reset_index()[list(df.columns)]
+
+
+def finalize_partials(df, value_name, stats=False, keys=KEYS):
+    """
+    Turn merged partials into `value_name` (mean) columns.
+
+    With stats=True also keep '<value>_min', '<value>_max' and, if m2 was
+    tracked, '<value>_std' (population standard deviation).
+    Count-only partials (no '<value>_sum') are returned unchanged.
+    """
+    if df.empty or f"{value_name}_sum" not in df.columns:
+        return df
+
+    count = df[f"{value_name}_count"]
+    out = df[keys].copy()
+    out[value_name] = df[f"{value_name}_sum"].where(count > 0) / count
+    if stats:
+        out[f"{value_name}_min"] = df[f"{value_name}_min"]
+        out[f"{value_name}_max"] = df[f"{value_name}_max"]
+        if f"{value_name}_m2" in df.columns:
+            out[f"{value_name}_std"] = np.sqrt(df[f"{value_name}_m2"].where(count > 0) / count)
+    return out
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+File-level manifest for incremental unify runs.
+
+The manifest is a JSON file stored next to the unified dataset. For every
+input file it records size, mtime, content hash, row count, binned time
+range and the (s2 prefix, day) partitions its partials were staged into,
+plus the settings the dataset was built with. plan_changes() compares it
+with the files on disk so only new/changed/removed files are reprocessed.
+"""
+
+import os
+import json
+import hashlib
+
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+def file_hash(path):
+    """SHA-256 of a file's content, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_key(path):
+    """Stable short key for a file path (used to name its staged partials)."""
+    return hashlib.sha1(os.path.normpath(path).encode("utf-8")).hexdigest()[:16]
+
+
+def new_manifest(settings):
+    return {"settings": settings, "files": {}}
+
+
+def load_manifest(path, settings):
+    """Load the manifest, or None if missing or built with other settings."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("settings") != settings:
+        print("⚠️ Manifest settings differ from the current configuration; rebuilding.")
+        return None
+    return manifest
+
+
+def save_manifest(path, manifest):
+    """Write the manifest atomically (temp file + rename)."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def plan_changes(manifest, files):
+    """
+    Compare {path: dataset} on disk with the manifest.
+
+    Size and mtime are the cheap first check: unchanged files are trusted,
+    new files and files whose size changed are reprocessed without hashing
+    (their hash is computed by the worker that reads them anyway). Only a
+    known file with the same size but a new mtime is hashed here, to tell
+    a touch from an edit. Returns (changed, removed, hashes) where `changed`
+    lists new or modified paths, `removed` lists manifest paths no longer on
+    disk and `hashes` maps the changed paths hashed here to their hash.
+    """
+    entries = manifest["files"]
+    changed, hashes = [], {}
+    for path in files:
+        st = os.stat(path)
+        entry = entries.get(path)
+        if entry is None or entry["size"] != st.st_size:
+            changed.append(path)
+            continue
+        if entry["mtime_ns"] == st.st_mtime_ns:
+            continue
+        digest = file_hash(path)
+        if entry["sha256"] == digest:
+            # Touched but identical: refresh mtime only
+            entry["mtime_ns"] = st.st_mtime_ns
+            continue
+        changed.append(path)
+        hashes[path] = digest
+
+    removed = [path for path in entries if path not in files]
+    return changed, removed, hashes
+
+
+def file_entry(path, dataset, digest, rows, time_range, partitions):
+    st = os.stat(path)
+    return {
+        "dataset": dataset,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": digest,
+        "rows": rows,
+        "time_min": time_range[0],
+        "time_max": time_range[1],
+        "partitions": sorted(partitions),
+    }
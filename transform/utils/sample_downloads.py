@@ -1,19 +1,28 @@
 #!/usr/bin/env python3
 import os
 import re
-import sys
 import math
+import errno
 import shutil
 import random
+import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Callable, Dict, List, Tuple
 
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks
+    fcntl = None
+
 # -------------------------
 # CONFIGURATION
 # -------------------------
 EXCLUDE_FOLDERS = {"sharks", "seaflower"}
 DEFAULT_RATIO = 0.0005  # 0.05 %
 MAX_FILE_SIZE_MB = 100  # absolute upper limit
+FICLONE = 0x40049409    # Linux ioctl: reflink (btrfs, XFS, ...)
+LINK_MODES = ("auto", "reflink", "hard")
 
 # -------------------------
 # Grouping methods (per dataset)
@@ -69,29 +78,40 @@ FOLDER_METHODS: Dict[str, Callable[[str], str]] = {
 # -------------------------
 
 def iter_files_recursive(root: Path):
-    """Yield all files recursively under root."""
-    for dirpath, _, filenames in os.walk(root):
-        for fn in filenames:
-            p = Path(dirpath) / fn
-            if p.is_file():
-                yield p
+    """
+    Yield (parent relative to root, os.DirEntry) for all files under root.
+
+    One os.scandir per directory: the entry's type and stat come from the
+    directory listing (stat is cached on the entry), and the relative
+    parent is built once per directory instead of once per file.
+    Symlinked directories are not followed, so a link loop or a link back
+    to the mirror root cannot recurse forever or sample outside the tree.
+    """
+    stack = [(root, Path("."))]
+    while stack:
+        path, rel = stack.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, rel / entry.name))
+                elif entry.is_file():
+                    yield rel, entry
 
 def group_files_under_data(data_dir: Path, key_fn: Callable[[str], str]):
     """Group files by item key."""
-    groups: Dict[Tuple[Path, str], List[Path]] = {}
-    for f in iter_files_recursive(data_dir):
-        size_mb = f.stat().st_size / (1024 * 1024)
+    groups: Dict[Tuple[Path, str], List[str]] = {}
+    for rel_parent, entry in iter_files_recursive(data_dir):
+        size_mb = entry.stat().st_size / (1024 * 1024)
         if size_mb > MAX_FILE_SIZE_MB:
             # skip large files entirely
             continue
-        rel_parent = f.parent.relative_to(data_dir)
-        item_key = key_fn(f.name)
-        groups.setdefault((rel_parent, item_key), []).append(f)
+        item_key = key_fn(entry.name)
+        groups.setdefault((rel_parent, item_key), []).append(entry.path)
     return groups
 
 def sample_groups(groups, ratio, seed):
     """Select a random subset of groups based on ratio."""
-    keys = list(groups.keys())
+    keys = sorted(groups)  # walk order depends on the filesystem; the seed should not
     if not keys:
         return []
     n_items = len(keys)
@@ -99,45 +119,99 @@ def sample_groups(groups, ratio, seed):
     rng = random.Random(seed)
     return rng.sample(keys, k=n_sample)
 
-def copy_selected(groups, selected_keys, data_dir, sample_dir):
-    """Copy selected groups to sample_dir."""
-    copied = 0
+def reflink(src: Path, dst: Path):
+    """Copy-on-write clone of src (shares blocks until either side is written)."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported on this platform")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            dst.unlink()
+            raise
+    shutil.copystat(src, dst)
+
+def place_file(src: Path, dst: Path, link: str | None = None) -> str:
+    """
+    Put src at dst: copy2 by default; with `link`, a reflink or hardlink.
+
+    "auto" tries reflink, then hardlink, then falls back to a copy
+    (e.g. across filesystems). Returns how the file was placed.
+    """
+    if dst.exists():
+        if dst.samefile(src):
+            if link in ("auto", "hard"):
+                return "hard"  # already linked by a previous run
+            dst.unlink()  # never write through a hardlink into the mirror
+        elif link:
+            dst.unlink()
+    if link:
+        if link in ("auto", "reflink"):
+            try:
+                reflink(src, dst)
+                return "reflink"
+            except OSError:
+                if link == "reflink":
+                    raise
+        try:
+            os.link(src, dst)
+            return "hard"
+        except OSError:
+            if link == "hard":
+                raise
+    shutil.copy2(src, dst)
+    return "copy"
+
+def copy_selected(groups, selected_keys, data_dir, sample_dir, link=None, executor=None):
+    """
+    Copy (or link) selected groups to sample_dir; returns {placement: n_files}.
+
+    Copies run on `executor` if given (the caller's shared pool; do not call
+    this from one of its own workers), else serially.
+    """
+    jobs = []
     for (rel_parent, _key) in selected_keys:
-        for src in groups[(rel_parent, _key)]:
-            dst_dir = sample_dir / rel_parent
-            dst_dir.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst_dir / src.name)
-            copied += 1
-    return copied
+        dst_dir = sample_dir / rel_parent
+        dst_dir.mkdir(parents=True, exist_ok=True)
+        jobs += [(Path(src), dst_dir / os.path.basename(src)) for src in groups[(rel_parent, _key)]]
+    counts: Dict[str, int] = {}
+    place = lambda job: place_file(*job, link)
+    for how in (executor.map(place, jobs) if executor is not None else map(place, jobs)):
+        counts[how] = counts.get(how, 0) + 1
+    return counts
 
 # -------------------------
 # Core logic
 # -------------------------
 
-def process_dataset(downloads_root: Path, dataset: str, ratio: float, seed: int | None):
-    ds_dir = downloads_root / dataset
-    data_dir = ds_dir / "data"
-    sample_dir = ds_dir / "sample"
-
+def plan_dataset(downloads_root: Path, dataset: str, ratio: float, seed: int | None):
+    """Walk and sample one dataset; returns (groups, selected keys) or None if there is nothing to sample."""
+    data_dir = downloads_root / dataset / "data"
     if not data_dir.is_dir():
         print(f"⚠️ Skipping '{dataset}': '{data_dir}' not found.")
-        return
+        return None
 
     key_fn = FOLDER_METHODS.get(dataset, key_generic)
     groups = group_files_under_data(data_dir, key_fn)
-
-    n_items = len(groups)
-    if n_items == 0:
+    if not groups:
         print(f"⚠️ No eligible (<{MAX_FILE_SIZE_MB} MB) files in '{data_dir}'.")
-        return
+        return None
+    return groups, sample_groups(groups, ratio, seed)
 
-    selected = sample_groups(groups, ratio, seed)
+def place_dataset(downloads_root: Path, dataset: str, groups, selected,
+                  link: str | None = None, executor=None):
+    """Copy/link the sampled groups of one dataset into <dataset>/sample/ and report."""
+    ds_dir = downloads_root / dataset
+    sample_dir = ds_dir / "sample"
     sample_dir.mkdir(parents=True, exist_ok=True)
-    copied = copy_selected(groups, selected, data_dir, sample_dir)
+    placed = copy_selected(groups, selected, ds_dir / "data", sample_dir, link, executor)
+    how = ", ".join(f"{n} {kind}" for kind, n in sorted(placed.items()))
+    n_items = len(groups)
 
     print(
         f"✅ [{dataset}] Sampled {len(selected)}/{n_items} groups "
-        f"→ Copied {copied} files (<{MAX_FILE_SIZE_MB} MB)."
+        f"→ {sum(placed.values())} files ({how or 'none'}, <{MAX_FILE_SIZE_MB} MB)."
     )
 
 # -------------------------
@@ -145,34 +219,39 @@ def process_dataset(downloads_root: Path, dataset: str, ratio: float, seed: int
 # -------------------------
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python sample_downloads.py <downloads_root> [--ratio 0.0005] [--seed 42]")
-        sys.exit(1)
-
-    downloads_root = Path(sys.argv[1]).expanduser().resolve()
-    ratio = DEFAULT_RATIO
-    seed = None
-
-    args = sys.argv[2:]
-    if "--ratio" in args:
-        try:
-            ratio = float(args[args.index("--ratio") + 1])
-        except Exception:
-            print("⚠️ Invalid ratio; using default 0.0005")
-    if "--seed" in args:
-        try:
-            seed = int(args[args.index("--seed") + 1])
-        except Exception:
-            pass
+    p = argparse.ArgumentParser(description="Copy a random sample of each downloaded dataset to <dataset>/sample/.")
+    p.add_argument("downloads_root")
+    p.add_argument("--ratio", type=float, default=DEFAULT_RATIO, help="Fraction of groups to sample (default: 0.0005)")
+    p.add_argument("--seed", type=int)
+    p.add_argument("--link", nargs="?", const="auto", choices=LINK_MODES,
+                   help="Reflink/hardlink samples instead of copying bytes "
+                        "(auto: reflink, else hardlink, else copy). Hardlinks share the "
+                        "inode with the mirror: do not modify samples in place.")
+    p.add_argument("-w", "--workers", type=int, default=min(8, os.cpu_count() or 1),
+                   help="Threads shared by dataset walks and file copies (default: min(8, CPUs))")
+    args = p.parse_args()
 
+    downloads_root = Path(args.downloads_root).expanduser().resolve()
     subfolders = [
         f for f in downloads_root.iterdir()
         if f.is_dir() and f.name not in EXCLUDE_FOLDERS
     ]
 
     print(f"🚀 Sampling {len(subfolders)} datasets under {downloads_root}")
-    for folder in subfolders:
-        process_dataset(downloads_root, folder.name, ratio, seed)
+    # Threads: walking and copying are I/O bound and release the GIL. One pool for
+    # both, so at most `workers` threads run; copies are submitted from this thread
+    # as each dataset's walk finishes (never from inside a pool worker).
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+        futs = {ex.submit(plan_dataset, downloads_root, folder.name, args.ratio, args.seed): folder.name
+                for folder in subfolders}
+        for fut in as_completed(futs):
+            dataset = futs[fut]
+            try:
+                plan = fut.result()
+                if plan is not None:
+                    place_dataset(downloads_root, dataset, *plan, link=args.link, executor=ex)
+            except OSError as e:
+                print(f"❌ [{dataset}] {e}")
 
 
 if __name__ == "__main__":
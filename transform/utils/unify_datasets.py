@@ -9,12 +9,23 @@ Now robust to column name variations like:
  - 'lon', 'long', 'Longitude' → longitude
 """
 
+import io
 import os
 import glob
+import hashlib
+import time
+import shutil
+import argparse
 import pandas as pd
 import numpy as np
-import s2sphere
+import pyarrow.parquet as pq
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from s2cells import latlng_to_cell_ids, cell_centers
+from binning import partial_aggregate, partial_count, merge_partials, finalize_partials
+from manifest import (load_manifest, save_manifest, new_manifest, plan_changes,
+                      file_entry, file_key)
 
 # =========================================================
 # CONFIG
@@ -33,6 +44,21 @@ S2_LEVEL = 8               # Spatial resolution (~1.2 km)
 OUTPUT_DIR = "data"
 OUTPUT_FILE = "unified_dataset.parquet"
 
+# Value column produced by each dataset
+VALUE_COLUMNS = {
+    "chlorophyll": "measure_chlorophyll",
+    "depth": "depth",
+    "eke": "eke_information",
+    "light": "normalized_light",
+    "sst": "sst",
+    "sharks": "shark_count"
+}
+
+# Streaming mode: on-disk partitions by (coarse S2 cell, day)
+PARTITION_S2_LEVEL = 4     # S2 ancestor level used as spatial partition key
+PARTIALS_DIR = "_partials" # per-file partials store, under OUTPUT_DIR
+MANIFEST_FILE = "unified_dataset.manifest.json"  # next to OUTPUT_FILE
+
 # =========================================================
 # HELPER FUNCTIONS
 # =========================================================
@@ -53,117 +79,335 @@ def normalize_columns(df):
 
 def to_s2_cell(lat, lon, level=S2_LEVEL):
     """Return S2 cell id for given lat/lon."""
-    latlng = s2sphere.LatLng.from_degrees(lat, lon)
-    return s2sphere.CellId.from_lat_lng(latlng).parent(level).id()
+    return int(latlng_to_cell_ids([lat], [lon], level)[0])
 
 
-def load_env_data(folder, value_name):
-    """Recursively load and standardize environmental data."""
-    files = glob.glob(os.path.join(folder, "**", "*.parquet"), recursive=True)
+def add_s2_cells(df, level=S2_LEVEL):
+    """Add a vectorized `s2_cell_id` column, dropping rows without coordinates."""
+    df = df.dropna(subset=["latitude", "longitude"])
+    return df.assign(s2_cell_id=latlng_to_cell_ids(
+        df["latitude"].to_numpy(dtype=np.float64),
+        df["longitude"].to_numpy(dtype=np.float64),
+        level,
+    ))
+
+
+def list_parquet_files(folder):
+    """Recursively list Parquet files under a dataset folder."""
+    return sorted(glob.glob(os.path.join(folder, "**", "*.parquet"), recursive=True))
+
+
+def read_binned_file(f, data=None):
+    """Read one file (or its already read bytes), normalize its columns and assign time_bin/s2_cell_id."""
+    df = pd.read_parquet(io.BytesIO(data) if data is not None else f)
+    df = normalize_columns(df)
+    if not all(c in df.columns for c in ["latitude", "longitude", "time_bin"]):
+        print(f"⚠️ Skipping {f}, missing one of lat/lon/time columns")
+        return None
+
+    df["time_bin"] = pd.to_datetime(df["time_bin"]).dt.floor(TIME_FREQ)
+    return add_s2_cells(df)
+
+
+def bin_file(f, value_name, stats=False, with_hash=False):
+    """
+    Reduce one file to (s2_cell_id, time_bin) partial aggregates.
+
+    Environmental files give sum/count/min/max partials (plus m2 when
+    `stats` is set, see binning.py); shark files give `shark_count`.
+    Returns None if the file is unreadable or lacks coordinates.
+    With `with_hash` returns (partial, sha256 of the file): the bytes are
+    read once and both hashed and parsed, so the manifest needs no extra pass.
+    """
+    digest = None
+    try:
+        data = None
+        if with_hash:
+            with open(f, "rb") as fh:
+                data = fh.read()
+            digest = hashlib.sha256(data).hexdigest()
+        df = read_binned_file(f, data)
+        if df is None:
+            partial = None
+        elif value_name == "shark_count":
+            partial = partial_count(df, "shark_count")
+        else:
+            partial = partial_aggregate(df, value_name, variance=stats)
+    except Exception as e:
+        print(f"❌ Error reading {f}: {e}")
+        partial = None
+    return (partial, digest) if with_hash else partial
+
+
+def combine_partials(partials, value_name, stats=False):
+    """Merge per-file partials and finalize them into one row per (s2_cell_id, time_bin)."""
+    return finalize_partials(merge_partials(partials), value_name, stats)
+
+
+def bin_files(tasks, workers=1, stats=False, with_hash=False):
+    """
+    Run bin_file over (path, value_name) tasks, yielding results in task order.
+
+    With workers > 1 files are reduced on a process pool; only the small
+    partial aggregates travel back to the parent.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for f, value_name in tasks:
+            yield bin_file(f, value_name, stats, with_hash)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        files, value_names = zip(*tasks)
+        yield from ex.map(bin_file, files, value_names, [stats] * len(tasks), [with_hash] * len(tasks))
+
+
+def dataset_tasks(name):
+    """(path, value_name) tasks for every Parquet file of a dataset."""
+    files = list_parquet_files(DATA_DIRS[name])
     if not files:
+        print(f"⚠️ No files found in {DATA_DIRS[name]}")
+    return [(f, VALUE_COLUMNS[name]) for f in files]
+
+
+def load_datasets(names, workers=1, stats=False):
+    """Load and bin several datasets through one shared pool of workers."""
+    tasks = [task for name in names for task in dataset_tasks(name)]
+    results = dict((name, []) for name in names)
+    owner = dict((value, name) for name, value in VALUE_COLUMNS.items())
+    for (_, value_name), partial in zip(tasks, bin_files(tasks, workers, stats)):
+        results[owner[value_name]].append(partial)
+    return dict((name, combine_partials(results[name], VALUE_COLUMNS[name], stats)) for name in names)
+
+
+def load_env_data(folder, value_name, workers=1, stats=False):
+    """Recursively load and standardize environmental data."""
+    tasks = [(f, value_name) for f in list_parquet_files(folder)]
+    if not tasks:
         print(f"⚠️ No files found in {folder}")
-        return pd.DataFrame()
-
-    dfs = []
-    for f in files:
-        try:
-            df = pd.read_parquet(f)
-            df = normalize_columns(df)
-            if not all(c in df.columns for c in ["latitude", "longitude", "time_bin"]):
-                print(f"⚠️ Skipping {f}, missing one of lat/lon/time columns")
-                continue
-
-            df["time_bin"] = pd.to_datetime(df["time_bin"]).dt.floor(TIME_FREQ)
-            df["s2_cell_id"] = [
-                to_s2_cell(lat, lon) for lat, lon in zip(df["latitude"], df["longitude"])
-            ]
-            df = df.groupby(["s2_cell_id", "time_bin"], as_index=False).mean(numeric_only=True)
-            # keep only relevant columns
-            keep_cols = ["s2_cell_id", "time_bin", value_name]
-            if value_name in df.columns:
-                df = df[keep_cols]
-            else:
-                df[value_name] = np.nan
-                df = df[keep_cols]
-            dfs.append(df)
-
-        except Exception as e:
-            print(f"❌ Error reading {f}: {e}")
-
-    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
-
-
-def load_sharks_data(folder):
+    return combine_partials(bin_files(tasks, workers, stats), value_name, stats)
+
+
+def load_sharks_data(folder, workers=1):
     """Recursively load and aggregate shark trajectory data."""
-    files = glob.glob(os.path.join(folder, "**", "*.parquet"), recursive=True)
-    if not files:
+    tasks = [(f, "shark_count") for f in list_parquet_files(folder)]
+    if not tasks:
         print(f"⚠️ No shark files found in {folder}")
-        return pd.DataFrame()
+    return combine_partials(bin_files(tasks, workers), "shark_count")
 
-    dfs = []
-    for f in files:
-        try:
-            df = pd.read_parquet(f)
-            df = normalize_columns(df)
-            if not all(c in df.columns for c in ["latitude", "longitude", "time_bin"]):
-                print(f"⚠️ Skipping {f}, missing one of lat/lon/time columns")
-                continue
 
-            df["time_bin"] = pd.to_datetime(df["time_bin"]).dt.floor(TIME_FREQ)
-            df["s2_cell_id"] = [
-                to_s2_cell(lat, lon) for lat, lon in zip(df["latitude"], df["longitude"])
-            ]
-            agg = df.groupby(["s2_cell_id", "time_bin"]).size().reset_index(name="shark_count")
-            dfs.append(agg)
-        except Exception as e:
-            print(f"❌ Error reading {f}: {e}")
+def get_s2_centers(s2_ids):
+    """Return DataFrame with geometric centers (lat, lon) of S2 cells."""
+    s2_ids = np.asarray(s2_ids, dtype=np.uint64)
+    lat, lon = cell_centers(s2_ids)
+    return pd.DataFrame({"s2_cell_id": s2_ids, "latitude": lat, "longitude": lon})
 
-    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
 
+def merge_datasets(datasets):
+    """Outer-join binned datasets on (s2_cell_id, time_bin) and add cell centers."""
+    base = datasets[0]
+    for df in datasets[1:]:
+        base = base.merge(df, on=["s2_cell_id", "time_bin"], how="outer")
 
-def get_s2_centers(s2_ids):
-    """Return DataFrame with geometric centers (lat, lon) of S2 cells."""
-    centers = []
-    for cell_id in s2_ids:
-        cell = s2sphere.Cell(s2sphere.CellId(cell_id))
-        center_point = cell.get_center()
-        latlng = s2sphere.LatLng.from_point(center_point)
-        lat, lon = latlng.lat().degrees, latlng.lng().degrees
-        centers.append((cell_id, lat, lon))
-    return pd.DataFrame(centers, columns=["s2_cell_id", "latitude", "longitude"])
+    # Add lat/lon centers for each s2_cell_id
+    centers = get_s2_centers(base["s2_cell_id"].dropna().unique())
+    return base.merge(centers, on="s2_cell_id", how="left")
+
+
+# =========================================================
+# STREAMING (OUT-OF-CORE) MODE
+# =========================================================
+def partition_prefix(s2_ids, level=PARTITION_S2_LEVEL):
+    """Coarse S2 ancestor (face + `level` quadtree steps) used as partition key."""
+    return np.asarray(s2_ids, dtype=np.uint64) >> np.uint64(64 - 3 - 2 * level)
+
+
+def stage_partitions(df, dataset_dir, key):
+    """
+    Split one file's partials by (s2 prefix, day) into the partials store.
+
+    Returns the partitions written, as 's2_prefix=<p>/day=<YYYY-MM-DD>' strings.
+    """
+    prefix = partition_prefix(df["s2_cell_id"].to_numpy())
+    day = df["time_bin"].dt.floor("D")
+    partitions = []
+    for (p, d), part in df.groupby([prefix, day], sort=False):
+        partition = f"s2_prefix={p}/day={d:%Y-%m-%d}"
+        part_dir = os.path.join(dataset_dir, *partition.split("/"))
+        os.makedirs(part_dir, exist_ok=True)
+        part.to_parquet(os.path.join(part_dir, f"{key}.parquet"), index=False)
+        partitions.append(partition)
+    return partitions
+
+
+def unstage_file(partials_dir, entry, key):
+    """Delete a file's staged partials; return the partitions they touched."""
+    for partition in entry["partitions"]:
+        path = os.path.join(partials_dir, entry["dataset"], *partition.split("/"), f"{key}.parquet")
+        if os.path.exists(path):
+            os.remove(path)
+    return set(entry["partitions"])
+
+
+def join_partition(partials_dir, names, partition, stats=False):
+    """Outer-join all datasets of one (s2 prefix, day) partition; None if empty."""
+    datasets = []
+    for name in names:
+        files = sorted(glob.glob(os.path.join(partials_dir, name, *partition.split("/"), "*.parquet")))
+        if files:
+            partials = [pd.read_parquet(f) for f in files]
+            datasets.append(combine_partials(partials, VALUE_COLUMNS[name], stats))
+    if not datasets:
+        return None
+    base = merge_datasets(datasets)
+
+    # Same columns and dtypes in every partition file, whatever joined here
+    value_cols = []
+    for name in names:
+        value_cols.append(VALUE_COLUMNS[name])
+        if stats and name != "sharks":
+            value_cols += [f"{VALUE_COLUMNS[name]}_{stat}" for stat in ("min", "max", "std")]
+    for col in value_cols:
+        base[col] = base[col].astype(np.float64) if col in base.columns else np.nan
+    return base[["s2_cell_id", "time_bin"] + value_cols + ["latitude", "longitude"]]
+
+
+def run_streaming(names, workers=1, stats=False, incremental=False):
+    """
+    Build the unified table partition by partition with bounded memory.
+
+    Every input file is reduced to partials on its own and spilled to
+    `OUTPUT_DIR/_partials/<dataset>/s2_prefix=/day=/<file key>.parquet`;
+    partitions are then joined one at a time and written to
+    `OUTPUT_FILE/day=<day>/part-<prefix>.parquet`. Peak memory is one input
+    file or one partition, not the whole mirror.
+
+    The partials store and a manifest (manifest.py) are kept, so with
+    `incremental` only new/changed/removed files are reprocessed and only
+    the partitions they touch are rewritten.
+    """
+    partials_dir = os.path.join(OUTPUT_DIR, PARTIALS_DIR)
+    output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILE)
+    manifest_path = os.path.join(OUTPUT_DIR, MANIFEST_FILE)
+    settings = dict(time_freq=TIME_FREQ, s2_level=S2_LEVEL,
+                    partition_s2_level=PARTITION_S2_LEVEL, stats=stats)
+
+    manifest = load_manifest(manifest_path, settings) if incremental else None
+    if manifest is None or not os.path.isdir(output_path):
+        # Full rebuild
+        manifest = new_manifest(settings)
+        shutil.rmtree(partials_dir, ignore_errors=True)
+        if os.path.isdir(output_path):
+            shutil.rmtree(output_path)
+        elif os.path.exists(output_path):
+            os.remove(output_path)
+
+    owner = dict((value, name) for name, value in VALUE_COLUMNS.items())
+    tasks = [task for name in names for task in dataset_tasks(name)]
+    files = dict((f, owner[value_name]) for f, value_name in tasks)
+    changed, removed, hashes = plan_changes(manifest, files)
+    print(f"🧾 {len(files)} files: {len(changed)} new/changed, {len(removed)} removed, "
+          f"{len(files) - len(changed)} unchanged")
+
+    affected = set()
+    for f in removed + changed:
+        if f in manifest["files"]:
+            affected |= unstage_file(partials_dir, manifest["files"].pop(f), file_key(f))
+
+    tasks = [(f, VALUE_COLUMNS[files[f]]) for f in changed]
+    for (f, _), (partial, digest) in zip(tasks, bin_files(tasks, workers, stats, with_hash=True)):
+        name = files[f]
+        if partial is None:
+            # Not in the manifest, so the next --incremental run retries it
+            print(f"⚠️ {os.path.basename(f)} not binned; it will be retried on the next run")
+            continue
+        partitions, time_range = [], (None, None)
+        if not partial.empty:
+            partitions = stage_partitions(partial, os.path.join(partials_dir, name), file_key(f))
+            time_range = (partial["time_bin"].min().isoformat(), partial["time_bin"].max().isoformat())
+        rows = pq.ParquetFile(f).metadata.num_rows
+        manifest["files"][f] = file_entry(f, name, digest or hashes.get(f), rows, time_range, partitions)
+        affected |= set(partitions)
+
+    n_rows = 0
+    for partition in sorted(affected):
+        prefix_dir, day_dir = partition.split("/")
+        out_file = os.path.join(output_path, day_dir, f"part-{prefix_dir.split('=', 1)[1]}.parquet")
+        part = join_partition(partials_dir, names, partition, stats)
+        if part is None:
+            if os.path.exists(out_file):
+                os.remove(out_file)
+            continue
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        part.to_parquet(out_file, index=False)
+        n_rows += len(part)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    save_manifest(manifest_path, manifest)
+    print(f"✅ Unified dataset saved to {output_path} ({len(affected)} partitions rewritten)")
+    print(f"📏 Rows rewritten: {n_rows}")
 
 
 # =========================================================
 # MAIN
 # =========================================================
+def benchmark(worker_counts):
+    """Time load_datasets for each worker count and check results are identical."""
+    names = list(DATA_DIRS)
+    n_files = sum(len(list_parquet_files(DATA_DIRS[name])) for name in names)
+    reference, base_time = None, None
+    for workers in worker_counts:
+        t0 = time.perf_counter()
+        loaded = load_datasets(names, workers)
+        elapsed = time.perf_counter() - t0
+        base_time = base_time or elapsed
+        if reference is None:
+            reference = loaded
+        identical = all(loaded[n].equals(reference[n]) for n in names)
+        print(f"⏱️ workers={workers:>3}: {elapsed:7.2f} s  {n_files / elapsed:7.1f} files/s  "
+              f"speedup x{base_time / elapsed:.2f}  identical={identical}")
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Unify environmental and shark datasets on an S2 × time grid.")
+    p.add_argument("--streaming", action="store_true",
+                   help="Out-of-core mode: partition inputs on disk and join partition by partition")
+    p.add_argument("--incremental", action="store_true",
+                   help="Streaming mode that only reprocesses new/changed files (see the manifest)")
+    p.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                   help="Processes used to bin input files (default: CPUs, 1 = serial)")
+    p.add_argument("--stats", action="store_true",
+                   help="Also output <value>_min/_max/_std per cell and time bin")
+    p.add_argument("--benchmark", metavar="N,N,...",
+                   help="Only time the binning stage for these worker counts, e.g. 1,2,4,8")
+    return p.parse_args()
+
+
 def main():
+    args = parse_args()
+
+    if args.benchmark:
+        benchmark([int(n) for n in args.benchmark.split(",")])
+        return
+
     print("🐋 Building unified spatiotemporal dataset (2-hour bins)...")
 
-    chl = load_env_data(DATA_DIRS["chlorophyll"], "measure_chlorophyll")
-    depth = load_env_data(DATA_DIRS["depth"], "depth")
-    eke = load_env_data(DATA_DIRS["eke"], "eke_information")
-    light = load_env_data(DATA_DIRS["light"], "normalized_light")
-    sst = load_env_data(DATA_DIRS["sst"], "sst")
-    sharks = load_sharks_data(DATA_DIRS["sharks"])
+    if args.streaming or args.incremental:
+        run_streaming(list(DATA_DIRS), args.workers, args.stats, args.incremental)
+        return
 
-    datasets = [chl, depth, eke, light, sst, sharks]
-    datasets = [d for d in datasets if not d.empty]
+    loaded = load_datasets(list(DATA_DIRS), args.workers, args.stats)
+    datasets = [d for d in loaded.values() if not d.empty]
 
     if not datasets:
         print("❌ No datasets loaded. Check folder paths.")
         return
 
-    # Merge all datasets
-    base = datasets[0]
-    for df in datasets[1:]:
-        base = base.merge(df, on=["s2_cell_id", "time_bin"], how="outer")
-
-    # Add lat/lon centers for each s2_cell_id
-    centers = get_s2_centers(base["s2_cell_id"].dropna().unique())
-    base = base.merge(centers, on="s2_cell_id", how="left")
+    base = merge_datasets(datasets)
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILE)
+    if os.path.isdir(output_path):
+        shutil.rmtree(output_path)
     base.to_parquet(output_path, index=False)
 
     print(f"✅ Unified dataset saved to {output_path}")